@@ -0,0 +1,576 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Noemi E. Cazzaniga - 2024
+@email: noemi.cazzaniga@polimi.it
+"""
+
+
+import asyncio
+import ssl
+import time
+import xml.etree.ElementTree as ET
+from requests import HTTPError
+from eurostat.eurostat import __Uri__, __agency_by_provider__, __ra__, __sa__,\
+                              __cache_codelist__, __check_breaker__,\
+                              __concat_chunks_df__, __df_to_tuples__, __emit__,\
+                              __finish_meta__, __format_dic__, __format_dims__,\
+                              __get_async_key__, __get_codelist_url__,\
+                              __get_constraint_url__, __get_data_entry__,\
+                              __get_data_urls__, __get_df_tail__, __get_df_url__,\
+                              __get_dic_kwargs__, __get_dsd_url__, __get_limiter__,\
+                              __get_par_id__, __get_provider__, __get_provider_index__,\
+                              __get_retry_wait__, __get_toc_provs__, __get_toc_url__,\
+                              __get_update_pars__, __get_validators__,\
+                              __is_meta_valid__, __is_retry__, __join_chunks__,\
+                              __load_codelist__, __load_meta__, __long_df__,\
+                              __merge_periods_df__, __merge_toc__, __new_meta__,\
+                              __parse_codelist__, __parse_constraint__, __parse_df_info__,\
+                              __parse_dims__, __parse_toc_content__, __parse_tsv__,\
+                              __parse_tsv_content_df__, __read_cached_data_df__,\
+                              __release__, __reverse_time__, __reverse_time_df__, __save_data_entry__, __save_meta__,\
+                              __save_validators__, __set_df_info__, __submit_job__,\
+                              __try_acquire__, __update_breaker__,\
+                              __update_provider_index__
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+
+async def get_data_async(code, flags=False, **kwargs):
+    """
+    Download an Eurostat dataset (of given code) without blocking the event loop.
+    Return it as a list of tuples.
+    """
+
+    filter_pars, reverse_time, cache, max_workers, incremental, session = \
+        __get_async_data_kwargs__(code, flags, kwargs)
+    async with __AsyncSession__(session) as s:
+        if cache:
+            df = await __get_cached_data_df_async__(s, code, flags, filter_pars, max_workers, incremental)
+            alldata = __df_to_tuples__(df)
+        else:
+            alldata = await __get_data_async__(s, code, flags, filter_pars, max_workers,
+                                               lambda content: __parse_tsv__(content, flags))
+            alldata = __join_chunks__([c for c in alldata if c is not None])
+    if reverse_time and alldata:
+        __reverse_time__(alldata, flags)
+    if alldata != []:
+        return alldata
+    else:
+        return None
+
+
+async def get_data_df_async(code, flags=False, **kwargs):
+    """
+    Download an Eurostat dataset (of given code) without blocking the event loop.
+    If compact, the dimensions and the flags are categorical
+    and the values are float32.
+    If layout is "long", there is a row per observation.
+    Return it as a Pandas dataframe.
+    """
+
+    compact = kwargs.pop("compact", False)
+    layout = kwargs.pop("layout", "wide")
+    assert type(compact) is bool, "Error: 'compact' must be a boolean."
+    assert layout in ["wide", "long"], "Error: 'layout' must be 'wide' or 'long'."
+    filter_pars, reverse_time, cache, max_workers, incremental, session = \
+        __get_async_data_kwargs__(code, flags, kwargs)
+    async with __AsyncSession__(session) as s:
+        if cache:
+            df = await __get_cached_data_df_async__(s, code, flags, filter_pars, max_workers, incremental,
+                                                    compact)
+        else:
+            if layout == "long":
+                parse = lambda content: __long_df__(__parse_tsv_content_df__(content, flags, compact),
+                                                    flags, reverse_time)
+            else:
+                parse = lambda content: __parse_tsv_content_df__(content, flags, compact)
+            df = __concat_chunks_df__(await __get_data_async__(s, code, flags, filter_pars, max_workers, parse))
+            if layout == "long":
+                return df
+    if df is None:
+        return None
+    if layout == "long":
+        return __long_df__(df, flags, reverse_time)
+    return __reverse_time_df__(df, flags) if reverse_time else df
+
+
+async def get_dic_async(code, par=None, **kwargs):
+    """
+    Download an Eurostat codelist with the descriptions
+    of the dimensions of a dataset or
+    of the parameter values, without blocking the event loop.
+    Return it as a Python list, a dataframe or a dictionary.
+    """
+
+    session = kwargs.pop("session", None)
+    frmt, full, lang = __get_dic_kwargs__(code, par, kwargs)
+
+    async with __AsyncSession__(session) as s:
+        if par:
+            meta = await __get_meta_async__(s, code, dims=True)
+            par_id = __get_par_id__(code, par, __format_dims__(meta, 'basic', lang))
+            if full:
+                l = await __get_codelist_async__(s, meta, par_id, lang)
+            else:
+                l, constraint = await __gather__([
+                    __get_codelist_async__(s, meta, par_id, lang),
+                    __get_constraint_async__(s, meta, code)])
+                par_values = set(constraint.get(par.lower(), []))
+                l = [el for el in l if el[0] in par_values]
+        else:
+            meta = await __get_meta_async__(s, code, dims=True, lang=lang)
+            l = __format_dims__(meta, 'descr', lang)
+    return __format_dic__(l, par, frmt)
+
+
+async def get_toc_async(**kwargs):
+    """
+    Download the Eurostat table of contents of all the datasets, or
+    of only one if the argument dataset is not 'all',
+    without blocking the event loop.
+    lang can be 'en'', 'fr', 'de'.
+    Return it as a list of tuples.
+    """
+
+    kwargs_opt = ['dataset', 'lang', 'session']
+    assert set(kwargs.keys()).issubset(kwargs_opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(kwargs_opt)))
+    dataset = kwargs.get('dataset', 'all')
+    lang = kwargs.get('lang', 'en')
+
+    provs = __get_toc_provs__(dataset)
+    async with __AsyncSession__(kwargs.get('session', None)) as s:
+        parts = await __gather__([__get_toc_part_async__(s, prov, dataset, lang) for prov in provs])
+    return __merge_toc__(provs, parts, dataset, lang)
+
+
+def __get_async_data_kwargs__(code, flags, kwargs):
+    opt = ["filter_pars", "reverse_time", "cache", "max_workers", "incremental", "session"]
+    assert set(kwargs).issubset(opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(opt)))
+    filter_pars = kwargs.get("filter_pars", dict())
+    reverse_time = kwargs.get("reverse_time", False)
+    cache = kwargs.get("cache", False)
+    max_workers = kwargs.get("max_workers", __sa__["max_workers"])
+    incremental = kwargs.get("incremental", False)
+    session = kwargs.get("session", None)
+    assert type(code) is str, "Error: 'code' must be a string."
+    assert type(flags) is bool, "Error: 'flags' must be a boolean."
+    assert type(filter_pars) is dict, "Error: 'filter_pars' must be a dictionary."
+    assert type(reverse_time) is bool, "Error: 'reverse_time' must be a boolean."
+    assert type(cache) is bool, "Error: 'cache' must be a boolean."
+    assert type(max_workers) is int and max_workers > 0, "Error: 'max_workers' must be a positive integer."
+    assert type(incremental) is bool, "Error: 'incremental' must be a boolean."
+    assert not incremental or cache, "Error: 'incremental' requires cache=True."
+    return filter_pars, reverse_time, cache, max_workers, incremental, session
+
+
+class __AsyncSession__():
+    """
+    Use the given aiohttp.ClientSession, or open a new one
+    with the settings of set_requests_args and close it at the end.
+    """
+
+    def __init__(self, session):
+        if aiohttp is None:
+            print("Error: the async functions require the package aiohttp.")
+            raise ImportError("aiohttp")
+        self.session = session
+        self.is_own = session is None
+
+    async def __aenter__(self):
+        if self.is_own:
+            connector = aiohttp.TCPConnector(limit_per_host=__sa__["pool_maxsize"],
+                                             force_close=(not __sa__["keep_alive"]),
+                                             ssl=__get_ssl__())
+            # as in requests, the timeout applies to the connection and to each read
+            timeout = __ra__.get("timeout", None)
+            if type(timeout) is not tuple:
+                timeout = (timeout, timeout)
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 timeout=aiohttp.ClientTimeout(total=None,
+                                                                               sock_connect=timeout[0],
+                                                                               sock_read=timeout[1]))
+        return self.session
+
+    async def __aexit__(self, *exc):
+        if self.is_own:
+            await self.session.close()
+
+
+def __get_ssl__():
+    verify = __ra__.get("verify", None)
+    cert = __ra__.get("cert", None)
+    if verify is False:
+        return False
+    if type(verify) is not str and cert is None:
+        return True
+    context = ssl.create_default_context(cafile=(verify if type(verify) is str else None))
+    if type(cert) is str:
+        context.load_cert_chain(cert)
+    elif cert is not None:
+        context.load_cert_chain(cert[0], cert[1])
+    return context
+
+
+def __get_proxy__(url):
+    proxies = __ra__.get("proxies", None) or dict()
+    return proxies.get(url.split(":")[0], None)
+
+
+async def __gather__(coros):
+    """
+    Run the coroutines concurrently.
+    If one of them fails, the others are cancelled.
+    Return the results in the same order as coros.
+    """
+
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+async def __get_raw_resp_async__(session, url, is_raise, headers=None):
+    """
+    Same as __get_raw_resp__, with the same retry policy and circuit breakers.
+    Return (status, headers, content) or None.
+    """
+
+    prov = __get_provider__(url)
+    n_att = 0
+    while True:
+        if not __check_breaker__(prov, is_raise):
+            return None
+        resp = None
+        last_exception = None
+        limiter = __get_limiter__(url)
+        await __acquire_async__(limiter)
+        start = time.time()
+        try:
+            async with session.get(url, proxy=__get_proxy__(url), headers=headers) as r:
+                resp = (r.status, r.headers, await r.read())
+                is_sorry = str(r.url) == "https://sorry.ec.europa.eu/"
+                status = None if is_sorry else r.status
+                retry_after = r.headers.get("Retry-After")
+        except Exception as e:
+            last_exception = e
+            is_sorry = False
+            status = None
+            retry_after = None
+        finally:
+            __release__(limiter)
+        is_retry = __is_retry__(status) and n_att < __sa__["max_retries"]
+        wait = __get_retry_wait__(n_att + 1, retry_after) if is_retry else None
+        is_too_long = is_retry and wait is None
+        is_retry = is_retry and not is_too_long
+        __emit__("request", url=url, provider=prov, status=status,
+                 bytes=0 if resp is None else len(resp[2]), attempt=n_att,
+                 retry=is_retry, duration=time.time() - start)
+        if not is_retry:
+            break
+        n_att += 1
+        await asyncio.sleep(wait)
+    __update_breaker__(prov, status)
+    if is_sorry:
+        print("Server inaccessibility\n")
+        print("The server is temporarily unavailable\n")
+        raise ConnectionError("The server is temporarily unavailable")
+    if is_too_long:
+        if is_raise:
+            print("Server inaccessibility: " + str(prov) + " asks to retry after more than " +
+                  str(__sa__["retry_after_max"]) + " sec. Try again later.\n")
+            __raise_for_status__(status, url)
+        return None
+    if resp is None and is_raise:
+        raise last_exception
+    return resp
+
+
+async def __acquire_async__(limiter):
+    """
+    Same as __acquire__, without blocking the event loop:
+    sleep until the next token is due, or wait for __release__
+    to wake the task when all the slots are busy.
+    """
+
+    loop = asyncio.get_running_loop()
+    while True:
+        with limiter["cond"]:
+            wait = __try_acquire__(limiter)
+            if wait is None:
+                return
+            if wait < 0:
+                waiter = loop.create_future()
+                limiter["waiters"].append((loop, waiter))
+        if wait >= 0:
+            await asyncio.sleep(wait)
+            continue
+        try:
+            await waiter
+        finally:
+            with limiter["cond"]:
+                if (loop, waiter) in limiter["waiters"]:
+                    limiter["waiters"].remove((loop, waiter))
+
+
+async def __get_resp_async__(session, url, **kwargs):
+    """
+    Return the content of the response to url, or None.
+    """
+
+    assert set(kwargs.keys()).issubset(['provider', 'is_raise'])
+    is_raise = kwargs.get("is_raise", True)
+    resp = await __get_raw_resp_async__(session, url, is_raise)
+    if resp is None:
+        return None
+    return await __check_resp_async__(session, resp[0], resp[2], is_raise, kwargs.get("provider", None))
+
+
+async def __check_resp_async__(session, http_status, content, is_raise, provider):
+    """
+    Handle the faults and the queued requests, as __get_resp__.
+    Return the content, or None.
+    """
+
+    if b"<S:Fault" in content:
+        if http_status < 400 or not is_raise:
+            return None
+        root = ET.fromstring(content)
+        for el in list(root):
+            print(": ".join([el.tag, el.text]))
+        __raise_for_status__(http_status, None)
+    elif b"status></" in content:
+        status, key = __get_async_key__(ET.fromstring(content))
+        if status == "AVAILABLE":
+            data_url = __Uri__.BASE_ASYNC_URL[provider] + "data/" + key
+        else:
+            data_url = await asyncio.wait_for(asyncio.wrap_future(__submit_job__(provider, key)),
+                                              __sa__["poll_timeout"])
+        return await __get_resp_async__(session, data_url)
+    return content
+
+
+def __raise_for_status__(status, url):
+    """
+    Raise the same HTTPError as raise_for_status of requests
+    if status is an error.
+    """
+
+    if 400 <= status < 500:
+        reason = "Client Error"
+    elif 500 <= status < 600:
+        reason = "Server Error"
+    else:
+        return
+    raise HTTPError(str(status) + " " + reason + ("" if url is None else " for url: " + url))
+
+
+async def __get_cond_resp_async__(session, url, parse, is_raise=True):
+    """
+    Same as __get_cond_resp__.
+    """
+
+    entry, headers = __get_validators__(url)
+    resp = await __get_raw_resp_async__(session, url, is_raise, headers)
+    if resp is None:
+        return None
+    status, resp_headers, content = resp
+    if entry is not None:
+        __emit__("cache", kind="http", key=url, hit=status == 304)
+    if status == 304 and entry is not None:
+        return entry["result"]
+    if status >= 300 and b"<S:Fault" not in content:
+        if is_raise:
+            __raise_for_status__(status, url)
+        return None
+    content = await __check_resp_async__(session, status, content, is_raise, None)
+    if content is None:
+        return None
+    result = parse(content)
+    __save_validators__(url, resp_headers, result)
+    return result
+
+
+async def __get_toc_part_async__(session, prov, dataset, lang):
+    """
+    Same as __get_toc_part__.
+    """
+
+    url = __get_toc_url__(prov, dataset, lang)
+    if dataset == 'all':
+        return await __get_cond_resp_async__(session, url,
+                                             lambda content: __parse_toc_content__(content, dataset), False)
+    content = await __get_resp_async__(session, url, is_raise=False)
+    if content is None:
+        return None
+    return __parse_toc_content__(content, dataset)
+
+
+async def __get_meta_async__(session, code, **kwargs):
+    """
+    Same as __get_meta__, sharing its cache.
+    """
+
+    need_dims = kwargs.get("dims", True)
+    lang = kwargs.get("lang", None)
+    key = code.upper()
+    meta = __load_meta__(key)
+    is_valid = __is_meta_valid__(meta, need_dims, lang)
+    __emit__("cache", kind="metadata", key=key, hit=is_valid)
+    if is_valid:
+        return meta
+
+    df_tail = __get_df_tail__(lang)
+    df_info = None
+    if meta is not None:
+        df_info = await __get_df_info_async__(session, code, meta["provider"], meta["agencyId"], df_tail)
+    if df_info is None:
+        meta = None
+        found = await __find_provider_async__(session, code, df_tail)
+        if found is not None:
+            meta = __new_meta__(found[0], found[1])
+            df_info = found[2]
+    if df_info is None:
+        print("Dataset not found: " + code)
+        raise ValueError
+    codelists = __set_df_info__(meta, df_info)
+    if (need_dims or lang) and meta["dims"] is None:
+        meta["dims"] = await __get_cond_resp_async__(session, __get_dsd_url__(meta), __parse_dims__)
+    return __finish_meta__(key, meta, codelists, lang)
+
+
+async def __find_provider_async__(session, code, df_tail):
+    """
+    Same as __find_provider__, with tasks instead of threads.
+    """
+
+    agencies = dict(__agency_by_provider__)
+    known = __get_provider_index__().get(code.upper(), None)
+    error = None
+    if known is not None:
+        try:
+            df_info = await __get_df_info_async__(session, code, known, agencies[known], df_tail)
+        except Exception as e:
+            df_info = None
+            error = e
+        if df_info is not None:
+            return [known, agencies[known], df_info]
+    tasks = [asyncio.ensure_future(__probe_provider_async__(session, code, provider, agencies[provider], df_tail))
+             for provider in __Uri__.BASE_URL
+             if provider in agencies and provider != known]
+    try:
+        # the first provider in __Uri__.BASE_URL order, whatever answers first
+        for fut in tasks:
+            try:
+                found = await fut
+            except Exception as e:
+                error = e
+                continue
+            if found[2] is not None:
+                __update_provider_index__({code.upper(): found[0]})
+                return found
+    finally:
+        for t in tasks:
+            t.cancel()
+    if error is not None:
+        raise error
+    return None
+
+
+async def __probe_provider_async__(session, code, provider, agencyId, df_tail):
+    df_info = await __get_df_info_async__(session, code, provider, agencyId, df_tail)
+    return [provider, agencyId, df_info]
+
+
+async def __get_df_info_async__(session, code, provider, agencyId, df_tail):
+    """
+    Same as __get_df_info__.
+    """
+
+    url = __get_df_url__(code, provider, agencyId, df_tail)
+    status, __, content = await __get_raw_resp_async__(session, url, True)
+    if status == 404 or (status < 400 and b"<S:Fault" in content):
+        return None
+    __raise_for_status__(status, url)
+    return __parse_df_info__(content)
+
+
+async def __get_codelist_async__(session, meta, par_id, lang):
+    """
+    Same as __get_codelist__, sharing its cache.
+    """
+
+    key = (meta["agencyId"], par_id, lang)
+    l = __load_codelist__(key)
+    if l is None:
+        url = __get_codelist_url__(meta["agencyId"], meta["provider"], par_id, lang)
+        l = await __get_cond_resp_async__(session, url, __parse_codelist__)
+        __cache_codelist__(key, l)
+    return l
+
+
+async def __get_constraint_async__(session, meta, code):
+    """
+    Same as __get_constraint__, sharing its cache.
+    """
+
+    if meta.get("constraint", None) is None:
+        url = __get_constraint_url__(code, meta["agencyId"], meta["provider"])
+        meta["constraint"] = __parse_constraint__(await __get_resp_async__(session, url))
+        __save_meta__(code.upper(), meta)
+    return meta["constraint"]
+
+
+async def __get_data_async__(session, code, flags, filter_pars, max_workers, parse):
+    """
+    Download the parts of a dataset, at most max_workers at the same time,
+    and parse each of them with parse as soon as it arrives.
+    Return the parsed parts in order (None for the parts without data).
+    """
+
+    meta = await __get_meta_async__(session, code, dims=True)
+    provider = meta["provider"]
+    dims = __format_dims__(meta, 'order', None)
+    urls = __get_data_urls__(code, dims, filter_pars, provider)
+    semaphore = asyncio.Semaphore(max_workers)
+    return await __gather__([__get_data_chunk_async__(session, semaphore, url, provider, parse)
+                             for url in urls])
+
+
+async def __get_data_chunk_async__(session, semaphore, data_url, provider, parse):
+    async with semaphore:
+        content = await __get_resp_async__(session, data_url, provider=provider)
+    if content is None:
+        return None
+    return parse(content)
+
+
+async def __get_cached_data_df_async__(session, code, flags, filter_pars, max_workers, incremental,
+                                       compact=False):
+    """
+    Same as __get_cached_data_df__.
+    """
+
+    meta = await __get_meta_async__(session, code, dims=True)
+    key, entry = __get_data_entry__(code, flags, filter_pars, compact)
+    df = __read_cached_data_df__(key, entry, meta["update_data"])
+    if df is not None:
+        return df
+    old_df, update_pars = __get_update_pars__(code, entry, filter_pars) if incremental else (None, None)
+    parse = lambda content: __parse_tsv_content_df__(content, flags, compact)
+    df = None
+    if update_pars is not None:
+        chunks = await __get_data_async__(session, code, flags, update_pars, max_workers, parse)
+        df = __merge_periods_df__(old_df, __concat_chunks_df__(chunks))
+    if df is None:
+        chunks = await __get_data_async__(session, code, flags, filter_pars, max_workers, parse)
+        df = __concat_chunks_df__(chunks)
+    if df is not None:
+        __save_data_entry__(key, code, flags, filter_pars, meta["update_data"], df)
+    return df
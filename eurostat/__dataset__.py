@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Noemi E. Cazzaniga - 2024
+@email: noemi.cazzaniga@polimi.it
+"""
+
+
+from eurostat.eurostat import __format_dic__, __format_dims__, __get_codelist__,\
+                              __get_constraint__, __get_dic_kwargs__, __get_meta__,\
+                              __get_par_id__, __read_data_df__
+
+
+class Dataset():
+    """
+    Handle of an Eurostat dataset (of given code).
+    The provider and the structure of the dataset are resolved at the
+    first use, and then kept (get_data_df checks the last update of the
+    data again). sel returns a new Dataset with a selection
+    of the data, which are downloaded only by get_data_df.
+    """
+
+    def __init__(self, code, flags=False):
+        assert type(code) is str, "Error: 'code' must be a string."
+        assert type(flags) is bool, "Error: 'flags' must be a boolean."
+        self.code = code
+        self.flags = flags
+        self.__meta__ = None
+        self.__dics__ = dict()
+        self.__selection__ = dict()
+
+    def __repr__(self):
+        return "Dataset(" + repr(self.code) + ", flags=" + repr(self.flags) + \
+            ", sel=" + repr(self.__selection__) + ")"
+
+    def __resolve__(self, lang=None):
+        if self.__meta__ is None or (lang is not None and lang not in self.__meta__["descr"]):
+            self.__meta__ = __get_meta__(self.code, dims=True, lang=lang)
+        return self.__meta__
+
+    @property
+    def provider(self):
+        return self.__resolve__()["provider"]
+
+    @property
+    def pars(self):
+        """
+        The parameters of the dataset, as get_pars.
+        """
+
+        return __format_dims__(self.__resolve__(), 'name', None)
+
+    @property
+    def par_values(self):
+        """
+        The values of all the parameters in the dataset,
+        as a dict {parameter: get_par_values}.
+        """
+
+        constraint = __get_constraint__(self.code, self.__resolve__())
+        return dict((par, list(constraint.get(par.lower(), []))) for par in self.pars)
+
+    @property
+    def codelists(self):
+        """
+        The descriptions of the values of all the parameters in the dataset,
+        as a dict {parameter: get_dic(par, frmt="dict")}.
+        """
+
+        return dict((par, self.get_dic(par, frmt="dict")) for par in self.pars)
+
+    def get_dic(self, par=None, **kwargs):
+        """
+        Same as get_dic. Each codelist is downloaded once.
+        """
+
+        frmt, full, lang = __get_dic_kwargs__(self.code, par, kwargs)
+        key = (par.lower() if par else None, full, lang)
+        if key not in self.__dics__:
+            if par:
+                meta = self.__resolve__()
+                l = __get_codelist__(meta["agencyId"], meta["provider"],
+                                     __get_par_id__(self.code, par, __format_dims__(meta, 'basic', lang)), lang)
+                if not full:
+                    par_values = set(__get_constraint__(self.code, meta).get(par.lower(), []))
+                    l = [el for el in l if el[0] in par_values]
+            else:
+                l = __format_dims__(self.__resolve__(lang), 'descr', lang)
+            self.__dics__[key] = l
+        return __format_dic__(self.__dics__[key], par, frmt)
+
+    def sel(self, **pars):
+        """
+        Select the data by parameter, e.g. geo=["AT", "BE"] or unit="EUR",
+        and by period, e.g. time=slice(2010, 2020) or time=2015.
+        The new selection of a parameter replaces the previous one.
+        Return a new Dataset: nothing is downloaded.
+        """
+
+        selection = dict(self.__selection__)
+        for par in pars:
+            values = pars[par]
+            if par.lower() in ["time", "time_period"]:
+                if type(values) is not slice:
+                    values = slice(values, values)
+                assert values.step is None, "Error: the time slice cannot have a step."
+                selection["time"] = values
+            else:
+                dims = __format_dims__(self.__resolve__(), 'basic', None)
+                __get_par_id__(self.code, par, dims)
+                name = [d[0] for d in dims if d[0].lower() == par.lower()][0]
+                selection[name] = list(values) if type(values) in [list, tuple, set] else [values, ]
+        ds = Dataset(self.code, self.flags)
+        ds.__meta__ = self.__meta__
+        ds.__dics__ = self.__dics__
+        ds.__selection__ = selection
+        return ds
+
+    @property
+    def filter_pars(self):
+        """
+        The filter_pars that download the selection: the values not in
+        the dataset are dropped, and the parameters with all their values
+        selected are not filtered, so that the requests are as few
+        and as short as possible.
+        None if no data can be selected.
+        """
+
+        filter_pars = dict()
+        constraint = None
+        for par in self.__selection__:
+            values = self.__selection__[par]
+            if par == "time":
+                if values.start is not None:
+                    filter_pars["startPeriod"] = values.start
+                if values.stop is not None:
+                    filter_pars["endPeriod"] = values.stop
+                continue
+            if constraint is None:
+                constraint = __get_constraint__(self.code, self.__resolve__())
+            if par.lower() in constraint:
+                available = set(constraint[par.lower()])
+                values = [v for v in values if str(v) in available]
+                if values == []:
+                    return None
+                if len(set(str(v) for v in values)) == len(available):
+                    continue
+            filter_pars[par] = values
+        return filter_pars
+
+    def get_data_df(self, **kwargs):
+        """
+        Download the selected data, with the same arguments as
+        get_data_df except filter_pars.
+        Return it as a Pandas dataframe, or None if there is no data.
+        """
+
+        assert "filter_pars" not in kwargs, "Argument not allowed: filter_pars"
+        # the last update of the data is read again (cached for metadata_max_age),
+        # so that the data cache is not checked against an old one
+        self.__meta__ = __get_meta__(self.code, dims=True)
+        meta = self.__meta__
+        filter_pars = self.filter_pars
+        if filter_pars is None:
+            return None
+        kwargs["filter_pars"] = filter_pars
+        dims_info = [meta["agencyId"], meta["provider"], __format_dims__(meta, 'order', None), meta["update_data"]]
+        return __read_data_df__(self.code, self.flags, kwargs, dims_info)
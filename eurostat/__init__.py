@@ -7,7 +7,16 @@
 from eurostat.eurostat import get_data, get_data_df,\
                               get_dic, get_pars, get_par_values,\
                               get_requests_args, get_toc, get_toc_df,\
-                              set_requests_args, setproxy, subset_toc_df
+                              set_requests_args, setproxy, subset_toc_df,\
+                              get_data_many, iter_data, download_to,\
+                              get_data_arrow, get_data_pl,\
+                              search_toc, search_toc_df,\
+                              get_cache_args, set_cache_args,\
+                              get_cache_info, clear_cache,\
+                              add_listener, remove_listener, collect_stats
+from eurostat.__dataset__ import Dataset
+from eurostat.__async_interface__ import get_data_async, get_data_df_async,\
+                                          get_dic_async, get_toc_async
 from eurostat.__old_sdmx_interface__ import get_avail_sdmx, get_avail_sdmx_df,\
                                             get_sdmx_data, get_sdmx_data_df,\
                                             get_sdmx_dic, get_sdmx_dims,\
@@ -17,4 +26,12 @@ __all__ = ['get_avail_sdmx', 'get_avail_sdmx_df', 'get_data', 'get_data_df',\
            'get_dic', 'get_pars', 'get_par_values', 'get_requests_args',\
            'get_sdmx_data', 'get_sdmx_data_df', 'get_sdmx_dic',\
            'get_sdmx_dims', 'get_toc', 'get_toc_df', 'set_requests_args',\
-           'setproxy', 'subset_avail_sdmx_df', 'subset_toc_df']
+           'setproxy', 'subset_avail_sdmx_df', 'subset_toc_df',\
+           'get_data_many', 'iter_data', 'download_to',\
+           'get_data_arrow', 'get_data_pl', 'Dataset',\
+           'search_toc', 'search_toc_df',\
+           'get_data_async', 'get_data_df_async',\
+           'get_dic_async', 'get_toc_async',\
+           'get_cache_args', 'set_cache_args',\
+           'get_cache_info', 'clear_cache',\
+           'add_listener', 'remove_listener', 'collect_stats']
@@ -8,14 +8,71 @@
 import requests
 import xml.etree.ElementTree as ET
 import json
+import logging
 import re
-from pandas import DataFrame
+import threading
+import zlib
+import codecs
+import time
+import random
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+import hashlib
+from importlib.util import find_spec
+from os import getpid, listdir, makedirs, path, remove, replace
+from requests.adapters import HTTPAdapter
+from pandas import Categorical, CategoricalDtype, DataFrame, Series, StringDtype, concat,\
+                   read_csv, read_feather, read_parquet, read_pickle, to_datetime, to_numeric
+from pandas.api.types import union_categoricals
+import numpy as np
 from gzip import decompress
-from itertools import product
+from io import BytesIO
+from itertools import chain
 
 
 
 __ra__ = {"timeout": 120.}
+__sa__ = {"pool_maxsize": 10, "keep_alive": True, "max_workers": 4,
+          "max_url_length": 2000, "max_combinations": 5000,
+          "poll_interval": 1., "poll_max_interval": 30., "poll_timeout": 3600.,
+          "max_retries": 3, "backoff_factor": 0.5, "backoff_max": 30., "retry_after_max": 120.,
+          "breaker_threshold": 5, "breaker_timeout": 60.,
+          "rate_limit": None, "rate_burst": 10, "max_in_flight": None}
+__sessions__ = dict()
+__sessions_lock__ = threading.Lock()
+__limiters__ = dict()
+__limiters_lock__ = threading.Lock()
+__breakers__ = dict()
+__breakers_lock__ = threading.Lock()
+__jobs__ = []
+__jobs_cond__ = threading.Condition()
+__jobs_thread__ = None
+__ca__ = {"metadata_size": 256, "metadata_dir": None, "metadata_max_age": 0.,
+          "toc_max_age": 3600.,
+          "data_dir": path.join(path.expanduser("~"), ".cache", "eurostat"),
+          "data_max_size": 1 << 30,
+          "data_format": "parquet" if find_spec("pyarrow") is not None else "pickle"}
+__meta_cache__ = OrderedDict()
+__meta_lock__ = threading.Lock()
+__data_lock__ = threading.RLock()
+__provider_index__ = dict()
+__toc_indexes__ = dict()
+__validators__ = OrderedDict()
+__codelists__ = OrderedDict()
+__listeners__ = []
+__logger__ = logging.getLogger("eurostat")
+__logger__.addHandler(logging.NullHandler())
+__tracer__ = None
+if find_spec("opentelemetry") is not None:
+    try:
+        from opentelemetry import trace
+        __tracer__ = trace.get_tracer("eurostat")
+    except ImportError:
+        pass
 __agency_by_provider__ = [("EUROSTAT", "ESTAT"),
                           ("COMEXT", "ESTAT"),
                           ("COMP", "COMP"),
@@ -67,14 +124,12 @@ class __Uri__():
         XMLSNS_S + "Dataflows/" +\
         XMLSNS_S + "Dataflow/" +\
         XMLSNS_S + "Structure/Ref"
-    dsd_update_data_path = \
+    dsd_annotation_path = \
         XMLSNS_M + "Structures/" +\
         XMLSNS_S + "Dataflows/" +\
         XMLSNS_S + "Dataflow/" +\
         XMLSNS_C + "Annotations/" +\
-        XMLSNS_C + "Annotation[" +\
-        XMLSNS_C + "AnnotationType='UPDATE_DATA']/" +\
-        XMLSNS_C + "AnnotationTitle"
+        XMLSNS_C + "Annotation"
     ref_path = \
         XMLSNS_S + "LocalRepresentation/" +\
         XMLSNS_S + "Enumeration/Ref"
@@ -98,6 +153,8 @@ class __Uri__():
         XMLSNS_M + "Structures/" +\
         XMLSNS_S + "Codelists/" +\
         XMLSNS_S + "Codelist"
+    codelist_name_path = codelist_path + "/" + XMLSNS_C + "Name"
+    codelist_descr_path = codelist_path + "/" + XMLSNS_C + "Description"
 
 
 def set_requests_args(**kwargs):
@@ -114,15 +171,93 @@ def set_requests_args(**kwargs):
         Default: None.
     - cert : user-provided SSL certificate. (optional)
        Default: None.
+    - pool_maxsize : max number of connections kept open to each provider. (optional)
+        Default: 10.
+    - keep_alive : reuse the connections between requests. (optional)
+        Default: True.
+    - max_workers : max number of parts of a dataset downloaded at the same time. (optional)
+        Default: 4.
+    - max_url_length : max length of the URLs built from filter_pars. (optional)
+        Default: 2000.
+    - max_combinations : max number of combinations of the filter_pars values
+        asked with a single request. (optional)
+        Default: 5000.
+    - poll_interval : seconds before the first check of the status of
+        a queued request. Then, the interval is doubled at each check. (optional)
+        Default: 1 sec.
+    - poll_max_interval : max seconds between two checks of the status
+        of a queued request. (optional)
+        Default: 30 sec.
+    - poll_timeout : max seconds waited for a queued request to be available,
+        before raising a TimeoutError. (optional)
+        Default: 3600 sec.
+    - max_retries : max number of retries of a request after a connection error,
+        or a status 408, 429 or 5xx. (optional)
+        Default: 3.
+    - backoff_factor : the wait before a retry is random, up to
+        backoff_factor * 2 ** (retry - 1) sec, unless the server
+        sends a Retry-After header. (optional)
+        Default: 0.5 sec.
+    - backoff_max : max wait before a retry, without Retry-After. (optional)
+        Default: 30 sec.
+    - retry_after_max : max wait asked by Retry-After. If the server asks
+        for a longer one, the request is not retried. (optional)
+        Default: 120 sec.
+    - breaker_threshold : number of consecutive failed requests after which
+        the requests to the same provider fail at once. (optional)
+        Default: 5.
+    - breaker_timeout : seconds during which the requests fail at once. (optional)
+        Default: 60 sec.
+    - rate_limit : max number of requests per second to each base URL
+        of the providers. (optional)
+        Default: None (no limit).
+    - rate_burst : max number of requests sent at once to a base URL
+        within rate_limit. (optional)
+        Default: 10.
+    - max_in_flight : max number of requests waiting for an answer from
+        each base URL of the providers. (optional)
+        Default: None (no limit).
     Return None.
 
     """
-    opt = ["timeout", "proxies", "verify", "cert"]
-    assert set(kwargs.keys()).issubset(opt), "Argument not allowed: " + \
-        ", ".join(list(set(kwargs).difference(opt)))
+    ra_opt = ["timeout", "proxies", "verify", "cert"]
+    sa_opt = ["pool_maxsize", "keep_alive", "max_workers", "max_url_length", "max_combinations",
+              "poll_interval", "poll_max_interval", "poll_timeout", "max_retries", "backoff_factor", "backoff_max",
+              "retry_after_max", "breaker_threshold", "breaker_timeout", "rate_limit", "rate_burst", "max_in_flight"]
+    assert set(kwargs.keys()).issubset(ra_opt + sa_opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(ra_opt + sa_opt)))
+    assert type(kwargs.get("pool_maxsize", 1)) is int and kwargs.get("pool_maxsize", 1) > 0,\
+        "Error: 'pool_maxsize' must be a positive integer."
+    assert type(kwargs.get("keep_alive", True)) is bool, "Error: 'keep_alive' must be a boolean."
+    for k in ["max_workers", "max_url_length", "max_combinations"]:
+        assert type(kwargs.get(k, 1)) is int and kwargs.get(k, 1) > 0,\
+            "Error: '" + k + "' must be a positive integer."
+    for k in ["poll_interval", "poll_max_interval", "poll_timeout"]:
+        assert type(kwargs.get(k, 1.)) in [int, float] and kwargs.get(k, 1.) > 0,\
+            "Error: '" + k + "' must be a positive number."
+    for k in ["backoff_factor", "backoff_max", "retry_after_max", "breaker_timeout"]:
+        assert type(kwargs.get(k, 0.)) in [int, float] and kwargs.get(k, 0.) >= 0,\
+            "Error: '" + k + "' must be a non-negative number."
+    assert type(kwargs.get("max_retries", 0)) is int and kwargs.get("max_retries", 0) >= 0,\
+        "Error: 'max_retries' must be a non-negative integer."
+    assert type(kwargs.get("breaker_threshold", 1)) is int and kwargs.get("breaker_threshold", 1) > 0,\
+        "Error: 'breaker_threshold' must be a positive integer."
+    assert kwargs.get("rate_limit", None) is None or\
+        (type(kwargs["rate_limit"]) in [int, float] and kwargs["rate_limit"] > 0),\
+        "Error: 'rate_limit' must be a positive number or None."
+    assert type(kwargs.get("rate_burst", 1)) is int and kwargs.get("rate_burst", 1) > 0,\
+        "Error: 'rate_burst' must be a positive integer."
+    assert kwargs.get("max_in_flight", None) is None or\
+        (type(kwargs["max_in_flight"]) is int and kwargs["max_in_flight"] > 0),\
+        "Error: 'max_in_flight' must be a positive integer or None."
     global __ra__
     for k in kwargs:
-        __ra__[k] = kwargs[k]
+        if k in ra_opt:
+            __ra__[k] = kwargs[k]
+        else:
+            __sa__[k] = kwargs[k]
+    if set(kwargs).intersection(["pool_maxsize", "keep_alive"]):
+        __close_sessions__()
 
 
 def get_requests_args():
@@ -131,7 +266,230 @@ def get_requests_args():
     Return a dict with arg names and their respective values.
     """
 
-    return __ra__
+    return dict(__ra__, **__sa__)
+
+
+def set_cache_args(**kwargs):
+    """
+    Allows to set the cache of the datasets metadata
+    (provider, dimensions, descriptions):
+    - metadata_size : number of datasets, and of codelists, kept in memory. (optional)
+        Default: 256.
+    - metadata_dir : folder where the metadata are also saved,
+        to reuse them in later sessions. (optional)
+        Default: None (no disk cache).
+    - metadata_max_age : seconds during which the cached metadata and codelists are used
+        without asking the server for the last update. (optional)
+        Default: 0 (the last update is always checked).
+    The cached metadata are refreshed when the structure of the dataset changes.
+    - toc_max_age : seconds during which the table of contents is searched
+        by search_toc without downloading it again. (optional)
+        Default: 3600.
+    Allows to set also the cache of the datasets,
+    used by get_data and get_data_df with cache=True:
+    - data_dir : folder of the datasets cache. (optional)
+        Default: "~/.cache/eurostat".
+    - data_max_size : max size of data_dir, in bytes. The datasets used
+        least recently are removed when it is exceeded. (optional)
+        Default: 1 GB.
+    - data_format : "parquet", "feather" (both require pyarrow) or "pickle". (optional)
+        Default: "parquet" if pyarrow is installed, "pickle" otherwise.
+    Return None.
+
+    """
+    opt = ["metadata_size", "metadata_dir", "metadata_max_age", "toc_max_age",
+           "data_dir", "data_max_size", "data_format"]
+    assert set(kwargs.keys()).issubset(opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(opt)))
+    assert type(kwargs.get("data_dir", "")) is str, "Error: 'data_dir' must be a string."
+    assert type(kwargs.get("data_max_size", 0)) is int and kwargs.get("data_max_size", 0) >= 0,\
+        "Error: 'data_max_size' must be a non-negative integer."
+    assert kwargs.get("data_format", "pickle") in ["parquet", "feather", "pickle"],\
+        "Error: 'data_format' must be 'parquet', 'feather' or 'pickle'."
+    assert type(kwargs.get("metadata_size", 0)) is int and kwargs.get("metadata_size", 0) >= 0,\
+        "Error: 'metadata_size' must be a non-negative integer."
+    assert kwargs.get("metadata_dir", None) is None or type(kwargs["metadata_dir"]) is str,\
+        "Error: 'metadata_dir' must be a string or None."
+    assert type(kwargs.get("metadata_max_age", 0.)) in [int, float],\
+        "Error: 'metadata_max_age' must be a number."
+    assert type(kwargs.get("toc_max_age", 0.)) in [int, float],\
+        "Error: 'toc_max_age' must be a number."
+    for k in kwargs:
+        __ca__[k] = kwargs[k]
+    with __meta_lock__:
+        while len(__meta_cache__) > __ca__["metadata_size"]:
+            __meta_cache__.popitem(last=False)
+
+
+def get_cache_args():
+    """
+    Get the current settings of the cache.
+    Return a dict with arg names and their respective values.
+    """
+
+    return dict(__ca__)
+
+
+def clear_cache(code=None):
+    """
+    Remove the cached metadata from memory and from metadata_dir, if set,
+    and the cached datasets from data_dir.
+    If code is given, only the cache of that dataset is removed.
+    Return None.
+    """
+
+    assert code is None or type(code) is str, "Error: 'code' must be a string."
+    key = None if code is None else code.upper()
+    with __meta_lock__:
+        if key is None:
+            __meta_cache__.clear()
+            __provider_index__.clear()
+            __toc_indexes__.clear()
+            __validators__.clear()
+            __codelists__.clear()
+        else:
+            __meta_cache__.pop(key, None)
+    if __ca__["metadata_dir"] is not None and path.isdir(__ca__["metadata_dir"]):
+        for fname in listdir(__ca__["metadata_dir"]):
+            if fname.endswith(".json") and (key is None or fname == key + ".json"):
+                remove(path.join(__ca__["metadata_dir"], fname))
+        http_dir = path.join(__ca__["metadata_dir"], "__http__")
+        if key is None and path.isdir(http_dir):
+            for fname in listdir(http_dir):
+                remove(path.join(http_dir, fname))
+    if path.isdir(__ca__["data_dir"]):
+        with __data_lock__:
+            index = __load_data_index__()
+            for k in list(index):
+                if key is None or index[k]["code"] == key:
+                    __remove_data_entry__(index, k)
+            __save_data_index__(index)
+
+
+def get_cache_info():
+    """
+    List the datasets in the cache (data_dir).
+    Return a list of tuples. The first element of the list contains the header line.
+    """
+
+    with __data_lock__:
+        index = __load_data_index__()
+    info = [("code",
+             "flags",
+             "filter_pars",
+             "last update of data",
+             "size",
+             "last access"), ]
+    for k in sorted(index, key=lambda k: index[k]["last_access"], reverse=True):
+        e = index[k]
+        info.append((e["code"],
+                     e["flags"],
+                     e["filter_pars"],
+                     e["update_data"],
+                     e["size"],
+                     time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(e["last_access"]))))
+    return info
+
+
+def add_listener(func):
+    """
+    Call func(event) for each event of the downloads, where event is a dict:
+    - {"event": "request", "url", "provider", "status", "bytes", "attempt",
+       "retry", "duration"} for each HTTP request (retry is True if it is
+       sent again);
+    - {"event": "queued", "url", "provider", "duration"} when a queued
+       request is available, after duration seconds;
+    - {"event": "parse", "decompress_time", "parse_time", "rows", "cells",
+       "duration"} for each part of a dataset;
+    - {"event": "cache", "kind", "key", "hit"} for each look up in the caches
+       of the metadata, the codelists, the datasets and the HTTP validators
+       (kind: "metadata", "codelist", "data", "http").
+    An exception raised by func is logged to the logger "eurostat",
+    and does not stop the downloads.
+    Return None.
+    """
+
+    assert callable(func), "Error: 'func' must be a function."
+    if func not in __listeners__:
+        __listeners__.append(func)
+
+
+def remove_listener(func):
+    """
+    Stop calling func for the events of the downloads.
+    Return None.
+    """
+
+    if func in __listeners__:
+        __listeners__.remove(func)
+
+
+@contextmanager
+def collect_stats():
+    """
+    Collect the statistics of the downloads done inside the with block,
+    in all the threads:
+    with eurostat.collect_stats() as stats:
+        ...
+    stats is a dict of the number of requests, retries, bytes, rows, cells,
+    cache hits and misses, of the seconds spent in requests, in queue,
+    decompressing and parsing, and of the URLs requested.
+    """
+
+    stats = {"requests": 0, "retries": 0, "bytes": 0, "request_time": 0.,
+             "queue_time": 0., "decompress_time": 0., "parse_time": 0.,
+             "rows": 0, "cells": 0, "cache_hits": 0, "cache_misses": 0,
+             "urls": []}
+    lock = threading.Lock()
+
+    def listener(event):
+        with lock:
+            if event["event"] == "request":
+                stats["requests"] += 1
+                stats["retries"] += event["retry"]
+                stats["bytes"] += event["bytes"]
+                stats["request_time"] += event["duration"]
+                stats["urls"].append(event["url"])
+            elif event["event"] == "queued":
+                stats["queue_time"] += event["duration"]
+            elif event["event"] == "parse":
+                for k in ["decompress_time", "parse_time", "rows", "cells"]:
+                    stats[k] += event[k]
+            elif event["event"] == "cache":
+                stats["cache_hits" if event["hit"] else "cache_misses"] += 1
+
+    add_listener(listener)
+    try:
+        yield stats
+    finally:
+        remove_listener(listener)
+
+
+def __emit__(event, **fields):
+    """
+    Send an event to the listeners, to the logger "eurostat" (level DEBUG,
+    INFO for the retries) and, if opentelemetry is installed, as a span
+    for the events with a duration.
+    """
+
+    if not __listeners__ and __tracer__ is None and not __logger__.isEnabledFor(logging.INFO):
+        return
+    fields["event"] = event
+    __logger__.log(logging.INFO if fields.get("retry", False) else logging.DEBUG,
+                   "%s %s", event, fields)
+    for func in list(__listeners__):
+        try:
+            func(dict(fields))
+        except Exception:
+            # a failing listener must not stop the downloads, nor the other listeners
+            __logger__.exception("Listener %r failed on the %s event", func, event)
+    if __tracer__ is not None and "duration" in fields:
+        end = time.time_ns()
+        span = __tracer__.start_span("eurostat." + event,
+                                     start_time=end - int(fields["duration"] * 1e9),
+                                     attributes=dict((k, v) for k, v in fields.items()
+                                                     if type(v) in [str, bool, int, float]))
+        span.end(end_time=end)
 
 
 def setproxy(proxyinfo):
@@ -163,46 +521,25 @@ def get_data(code, flags=False, **kwargs):
     Return it as a list of tuples.
     """
 
-    opt = ["filter_pars", "verbose", "reverse_time", "cache"]
-    assert set(kwargs).issubset(opt), "Argument not allowed: " + \
-        ", ".join(list(set(kwargs).difference(opt)))
-    filter_pars = kwargs.get("filter_pars", dict())
-    verbose = kwargs.get("verbose", False)
-    reverse_time = kwargs.get("reverse_time", False)
-    cache = kwargs.get("cache", None)
-    assert type(code) is str, "Error: 'code' must be a string."
-    assert type(flags) is bool, "Error: 'flags' must be a boolean."
-    assert type(filter_pars) is dict, "Error: 'filter_pars' must be a dictionary."
-    assert type(verbose) is bool, "Error: 'verbose' must be a boolean."
-    assert type(reverse_time) is bool, "Error: 'reverse_time' must be a boolean."
-    assert cache is None or callable(cache), "Error: 'cache' must be a function or None."
+    filter_pars, verbose, reverse_time, cache, max_workers, incremental = \
+        __get_data_kwargs__(code, flags, kwargs)
     __, provider, dims, dsd_last_update = __get_dims_info__(code, detail='order')
 
-    if cache:
-        cached_get_data = cache(__get_data__, ignore=["dims", "verbose", "provider"], verbose=verbose)
-        alldata = cached_get_data(code, dims, flags, filter_pars, verbose, provider, dsd_last_update)
+    if cache is True:
+        df = __get_cached_data_df__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers,
+                                    incremental)
+        alldata = __df_to_tuples__(df)
+    elif cache:
+        cached_get_data = cache(__get_data__, ignore=["dims", "verbose", "provider", "max_workers"], verbose=verbose)
+        alldata = cached_get_data(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers)
     else:
-        alldata = __get_data__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update)
+        alldata = __get_data__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers)
 
     if verbose:
         print("\n")
 
-    if reverse_time:
-        if flags:
-            for en1, a in enumerate(alldata):
-                valflags = list(a[n_text_fields:])
-                valflags.reverse()
-                for en2, v in enumerate(valflags):
-                    if en2 % 2 == 0:
-                        fl = v
-                    else:
-                        valflags[en2 - 1] = v
-                        valflags[en2] = fl
-                alldata[en1] = a[:n_text_fields] + tuple(valflags)
-        else:
-            for en, a in enumerate(alldata):
-                alldata[en] = a[:n_text_fields] + \
-                                tuple([val for val in list(a[n_text_fields:]).__reversed__()])
+    if reverse_time and alldata:
+        __reverse_time__(alldata, flags)
 
     if alldata != []:
         return alldata
@@ -210,18 +547,421 @@ def get_data(code, flags=False, **kwargs):
         return None
 
 
+def __reverse_time__(alldata, flags):
+    """
+    Reverse in place the order of the periods of a list of tuples.
+    """
+
+    n_text_fields = [i for i, c in enumerate(alldata[0]) if "\\" in c][0] + 1
+    if flags:
+        for en1, a in enumerate(alldata):
+            valflags = list(a[n_text_fields:])
+            valflags.reverse()
+            for en2, v in enumerate(valflags):
+                if en2 % 2 == 0:
+                    fl = v
+                else:
+                    valflags[en2 - 1] = v
+                    valflags[en2] = fl
+            alldata[en1] = a[:n_text_fields] + tuple(valflags)
+    else:
+        for en, a in enumerate(alldata):
+            alldata[en] = a[:n_text_fields] + \
+                            tuple([val for val in list(a[n_text_fields:]).__reversed__()])
+
+
 def get_data_df(code, flags=False, **kwargs):
     """
     Download an Eurostat dataset (of given code).
+    If compact, the dimensions and the flags are categorical
+    and the values are float32.
+    If layout is "long", there is a row per observation:
+    the dimensions, time, value and flag (if flags).
     Return it as a Pandas dataframe.
     """
 
-    d = get_data(code, flags, **kwargs)
+    return __read_data_df__(code, flags, kwargs)
+
+
+def __read_data_df__(code, flags, kwargs, dims_info=None):
+    """
+    Same as get_data_df. If dims_info is given, it is used
+    instead of resolving the dataset again (see __get_dims_info__).
+    """
+
+    compact = kwargs.pop("compact", False)
+    layout = kwargs.pop("layout", "wide")
+    assert type(compact) is bool, "Error: 'compact' must be a boolean."
+    assert layout in ["wide", "long"], "Error: 'layout' must be 'wide' or 'long'."
+    filter_pars, verbose, reverse_time, cache, max_workers, incremental = \
+        __get_data_kwargs__(code, flags, kwargs)
+    if dims_info is None:
+        dims_info = __get_dims_info__(code, detail='order')
+    __, provider, dims, dsd_last_update = dims_info
+    long = layout == "long"
 
-    if d != None:
-        return DataFrame(d[1:], columns=d[0])
+    if cache is True:
+        df = __get_cached_data_df__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers,
+                                    incremental, compact)
+        if long:
+            df = __long_df__(df, flags, reverse_time)
+    elif cache:
+        cached_get_data_df = cache(__get_data_df__, ignore=["dims", "verbose", "provider", "max_workers"], verbose=verbose)
+        df = cached_get_data_df(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers,
+                                compact, long, reverse_time)
     else:
+        df = __get_data_df__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers,
+                             compact, long, reverse_time)
+
+    if verbose:
+        print("\n")
+
+    if df is None:
         return
+    if reverse_time and not long:
+        df = __reverse_time_df__(df, flags)
+    return df
+
+
+def __reverse_time_df__(df, flags):
+    """
+    Return the dataframe with the order of the period columns reversed.
+    """
+
+    n_text_fields = [i for i, c in enumerate(df.columns) if "\\" in c][0] + 1
+    time_cols = list(df.columns[n_text_fields:])
+    if flags:
+        time_cols = [c for i in range(len(time_cols) - 2, -1, -2) for c in time_cols[i:i + 2]]
+    else:
+        time_cols.reverse()
+    return df[list(df.columns[:n_text_fields]) + time_cols]
+
+
+def iter_data(code, flags=False, **kwargs):
+    """
+    Download an Eurostat dataset (of given code) as a stream.
+    Rows are parsed while they arrive, without keeping the full dataset in memory.
+    Return a generator of tuples: the first one is the header.
+    """
+
+    opt = ["filter_pars", "chunk_size"]
+    assert set(kwargs).issubset(opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(opt)))
+    filter_pars = kwargs.get("filter_pars", dict())
+    chunk_size = kwargs.get("chunk_size", 1 << 16)
+    assert type(code) is str, "Error: 'code' must be a string."
+    assert type(flags) is bool, "Error: 'flags' must be a boolean."
+    assert type(filter_pars) is dict, "Error: 'filter_pars' must be a dictionary."
+    assert type(chunk_size) is int and chunk_size > 0, "Error: 'chunk_size' must be a positive integer."
+    __, provider, dims, __ = __get_dims_info__(code, detail='order')
+
+    is_header = False
+    for url in __get_data_urls__(code, dims, filter_pars, provider):
+        rows = __iter_data_chunk__(url, flags, provider, chunk_size)
+        head = next(rows, None)
+        if head is None:
+            continue
+        if not is_header:
+            is_header = True
+            yield head
+        for row in rows:
+            yield row
+
+
+def get_data_many(codes, flags=False, **kwargs):
+    """
+    Download several Eurostat datasets at the same time.
+    codes is a list of codes, or a dict {code: filter_pars}.
+    All the parts of all the datasets are downloaded by max_workers threads.
+    If sink is given, sink(code, dataframe) is called for each dataset
+    as soon as it is downloaded, instead of keeping it.
+    compact and layout are the same as in get_data_df.
+    Return a dict {code: dataframe} and a dict {code: exception}
+    for the datasets that could not be downloaded.
+    """
+
+    opt = ["verbose", "cache", "max_workers", "sink", "compact", "layout"]
+    assert set(kwargs).issubset(opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(opt)))
+    verbose = kwargs.get("verbose", False)
+    compact = kwargs.get("compact", False)
+    layout = kwargs.get("layout", "wide")
+    cache = kwargs.get("cache", False)
+    max_workers = kwargs.get("max_workers", __sa__["max_workers"])
+    sink = kwargs.get("sink", None)
+    assert type(codes) in [list, dict], "Error: 'codes' must be a list or a dictionary."
+    if type(codes) is list:
+        codes = dict((code, dict()) for code in codes)
+    assert all(type(code) is str for code in codes), "Error: the codes must be strings."
+    assert all(type(fp) is dict for fp in codes.values()), "Error: 'filter_pars' must be a dictionary."
+    assert type(flags) is bool, "Error: 'flags' must be a boolean."
+    assert type(verbose) is bool, "Error: 'verbose' must be a boolean."
+    assert type(cache) is bool, "Error: 'cache' must be a boolean."
+    assert type(max_workers) is int and max_workers > 0, "Error: 'max_workers' must be a positive integer."
+    assert sink is None or callable(sink), "Error: 'sink' must be a function or None."
+    assert type(compact) is bool, "Error: 'compact' must be a boolean."
+    assert layout in ["wide", "long"], "Error: 'layout' must be 'wide' or 'long'."
+
+    # one table of contents is cheaper than looking for many providers
+    known = __get_provider_index__()
+    unknown = [code for code in codes if code.upper() not in known and __load_meta__(code.upper()) is None]
+    if len(unknown) > len(__agency_by_provider__):
+        try:
+            get_toc()
+        except Exception:
+            pass
+
+    results = dict()
+    errors = dict()
+    parts = dict()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # future: (code, index of the part, or None for the metadata)
+    pending = dict((executor.submit(__get_dims_info__, code, detail='order'), (code, None))
+                   for code in codes)
+    n_done = 0
+    if verbose:
+        print("\rDownload progress: {:3.1%}".format(0), end="\r")
+    try:
+        while pending:
+            done, __ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                code, i = pending.pop(fut)
+                if code in errors:
+                    continue
+                try:
+                    res = fut.result()
+                    df = None
+                    is_done = False
+                    if i is None:
+                        __, provider, dims, update_data = res
+                        key, entry = __get_data_entry__(code, flags, codes[code], compact)
+                        if cache:
+                            df = __read_cached_data_df__(key, entry, update_data)
+                        if df is not None:
+                            is_done = True
+                        else:
+                            urls = __get_data_urls__(code, dims, codes[code], provider)
+                            parts[code] = {"chunks": [None] * len(urls), "left": len(urls),
+                                           "key": key, "update_data": update_data}
+                            for j, url in enumerate(urls):
+                                pending[executor.submit(__get_data_chunk_df__, url, flags, provider,
+                                                        compact)] = (code, j)
+                    else:
+                        parts[code]["chunks"][i] = res
+                        parts[code]["left"] -= 1
+                        if parts[code]["left"] == 0:
+                            part = parts.pop(code)
+                            df = __concat_chunks_df__(part["chunks"])
+                            if cache and df is not None:
+                                __save_data_entry__(part["key"], code, flags, codes[code], part["update_data"], df)
+                            is_done = True
+                    if is_done:
+                        if layout == "long":
+                            df = __long_df__(df, flags)
+                        if sink is not None:
+                            sink(code, df)
+                        else:
+                            results[code] = df
+                except Exception as e:
+                    errors[code] = e
+                    parts.pop(code, None)
+                    is_done = True
+                if is_done:
+                    n_done += 1
+                    if verbose:
+                        print("\rDownload progress: {:3.1%}".format(n_done / len(codes)), end="\r")
+    finally:
+        for fut in pending:
+            fut.cancel()
+        executor.shutdown(wait=True)
+    if verbose:
+        print("\n")
+    return results, errors
+
+
+def download_to(code, dest, flags=False, **kwargs):
+    """
+    Download an Eurostat dataset (of given code) to files in the folder dest.
+    Each part is parsed and written by batches of batch_size bytes,
+    so that the memory used does not depend on the size of the dataset.
+    frmt can be "parquet" (requires pyarrow) or "csv".
+    If partition_by is a list of dimensions, the files are written in the
+    subfolders dimension=value (Hive partitioning).
+    Return the list of the files written.
+    """
+
+    opt = ["filter_pars", "frmt", "partition_by", "max_workers", "batch_size", "verbose"]
+    assert set(kwargs).issubset(opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(opt)))
+    filter_pars = kwargs.get("filter_pars", dict())
+    frmt = kwargs.get("frmt", "parquet")
+    partition_by = kwargs.get("partition_by", [])
+    max_workers = kwargs.get("max_workers", __sa__["max_workers"])
+    batch_size = kwargs.get("batch_size", 1 << 24)
+    verbose = kwargs.get("verbose", False)
+    assert type(code) is str, "Error: 'code' must be a string."
+    assert type(dest) is str, "Error: 'dest' must be a string."
+    assert not path.exists(dest) or (path.isdir(dest) and listdir(dest) == []),\
+        "Error: 'dest' must be a new or empty folder."
+    assert type(flags) is bool, "Error: 'flags' must be a boolean."
+    assert type(filter_pars) is dict, "Error: 'filter_pars' must be a dictionary."
+    assert frmt in ["parquet", "csv"], "Error: 'frmt' must be 'parquet' or 'csv'."
+    assert frmt != "parquet" or find_spec("pyarrow") is not None, "Error: frmt='parquet' requires pyarrow."
+    assert type(partition_by) is list and all(type(p) is str for p in partition_by),\
+        "Error: 'partition_by' must be a list of strings."
+    assert type(max_workers) is int and max_workers > 0, "Error: 'max_workers' must be a positive integer."
+    assert type(batch_size) is int and batch_size > 0, "Error: 'batch_size' must be a positive integer."
+    assert type(verbose) is bool, "Error: 'verbose' must be a boolean."
+    __, provider, dims, __ = __get_dims_info__(code, detail='order')
+    dims_names = [d[1].lower() for d in dims]
+    for p in partition_by:
+        if p.lower() not in dims_names:
+            print("Error: " + p + " not in " + code)
+            raise ValueError
+
+    makedirs(dest, exist_ok=True)
+    urls = __get_data_urls__(code, dims, filter_pars, provider)
+    files = __get_chunks__(list(enumerate(urls)),
+                           lambda item: __download_part__(item[1], "part-%05d" % item[0], dest, flags, provider,
+                                                          frmt, partition_by, batch_size),
+                           verbose,
+                           max_workers)
+    if verbose:
+        print("\n")
+    return sorted(set(f for part in files for f in part))
+
+
+def __download_part__(data_url, name, dest, flags, provider, frmt, partition_by, batch_size):
+    """
+    Write one part of a dataset to the files name.parquet or name.csv
+    in dest (or in its partition subfolders), batch by batch.
+    Return the list of the files written.
+    """
+
+    files = []
+    writer = None
+    try:
+        batches = __iter_data_batches__(data_url, provider, batch_size, lambda dec: __parse_tsv_df__(dec, flags))
+        for n_batch, df in enumerate(batches):
+            if partition_by == []:
+                groups = [(dest, df)]
+            else:
+                cols = [c for p in partition_by for c in df.columns if c.split("\\")[0].lower() == p.lower()]
+                groups = []
+                for values, group in df.groupby(cols, sort=False, dropna=False):
+                    folder = path.join(dest, *[c.split("\\")[0] + "=" + str(v) for c, v in zip(cols, values)])
+                    groups.append((folder, group.drop(columns=cols)))
+            for folder, group in groups:
+                makedirs(folder, exist_ok=True)
+                if frmt == "csv":
+                    fname = path.join(folder, name + ".csv")
+                    group.to_csv(fname, mode="a" if fname in files else "w", header=fname not in files,
+                                 index=False)
+                elif partition_by == []:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                    fname = path.join(folder, name + ".parquet")
+                    if writer is None:
+                        table = pa.Table.from_pandas(group, preserve_index=False)
+                        writer = pq.ParquetWriter(fname, table.schema)
+                    else:
+                        table = pa.Table.from_pandas(group, schema=writer.schema, preserve_index=False)
+                    writer.write_table(table)
+                else:
+                    # one file per batch, to keep few files open
+                    fname = path.join(folder, name + "-%05d.parquet" % n_batch)
+                    group.to_parquet(fname, index=False)
+                if fname not in files:
+                    files.append(fname)
+    finally:
+        if writer is not None:
+            writer.close()
+    return files
+
+
+def get_data_arrow(code, flags=False, **kwargs):
+    """
+    Download an Eurostat dataset (of given code), parsed by pyarrow
+    without building pandas objects. The dimensions and the flags
+    are dictionary-encoded.
+    If stream, return a generator of pyarrow RecordBatches, parsed
+    every batch_size bytes of data while the parts are downloaded.
+    Return it as a pyarrow Table.
+    """
+
+    opt = ["filter_pars", "verbose", "max_workers", "stream", "batch_size"]
+    assert set(kwargs).issubset(opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(opt)))
+    filter_pars = kwargs.get("filter_pars", dict())
+    verbose = kwargs.get("verbose", False)
+    max_workers = kwargs.get("max_workers", __sa__["max_workers"])
+    stream = kwargs.get("stream", False)
+    batch_size = kwargs.get("batch_size", 1 << 24)
+    assert find_spec("pyarrow") is not None, "Error: get_data_arrow requires pyarrow."
+    assert type(code) is str, "Error: 'code' must be a string."
+    assert type(flags) is bool, "Error: 'flags' must be a boolean."
+    assert type(filter_pars) is dict, "Error: 'filter_pars' must be a dictionary."
+    assert type(verbose) is bool, "Error: 'verbose' must be a boolean."
+    assert type(max_workers) is int and max_workers > 0, "Error: 'max_workers' must be a positive integer."
+    assert type(stream) is bool, "Error: 'stream' must be a boolean."
+    assert type(batch_size) is int and batch_size > 0, "Error: 'batch_size' must be a positive integer."
+    __, provider, dims, __ = __get_dims_info__(code, detail='order')
+    urls = __get_data_urls__(code, dims, filter_pars, provider)
+
+    if stream:
+        return __iter_data_arrow__(urls, flags, provider, batch_size)
+    import pyarrow as pa
+    tables = __get_chunks__(urls,
+                            lambda url: __get_data_chunk_arrow__(url, flags, provider),
+                            verbose,
+                            max_workers)
+    if verbose:
+        print("\n")
+    tables = [t for t in tables if t is not None]
+    if tables == []:
+        return None
+    elif len(tables) == 1:
+        return tables[0]
+    # the parts can have different periods
+    return pa.concat_tables(tables, promote_options="default")
+
+
+def get_data_pl(code, flags=False, **kwargs):
+    """
+    Download an Eurostat dataset (of given code), as get_data_arrow.
+    The dimensions and the flags are categorical.
+    Return it as a Polars dataframe.
+    """
+
+    assert find_spec("polars") is not None, "Error: get_data_pl requires polars."
+    assert "stream" not in kwargs, "Argument not allowed: stream"
+    table = get_data_arrow(code, flags, **kwargs)
+    if table is None:
+        return None
+    import polars as pl
+    return pl.from_arrow(table)
+
+
+def __get_data_kwargs__(code, flags, kwargs):
+    opt = ["filter_pars", "verbose", "reverse_time", "cache", "max_workers", "incremental"]
+    assert set(kwargs).issubset(opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(opt)))
+    filter_pars = kwargs.get("filter_pars", dict())
+    verbose = kwargs.get("verbose", False)
+    reverse_time = kwargs.get("reverse_time", False)
+    cache = kwargs.get("cache", None)
+    max_workers = kwargs.get("max_workers", __sa__["max_workers"])
+    incremental = kwargs.get("incremental", False)
+    assert type(code) is str, "Error: 'code' must be a string."
+    assert type(flags) is bool, "Error: 'flags' must be a boolean."
+    assert type(filter_pars) is dict, "Error: 'filter_pars' must be a dictionary."
+    assert type(verbose) is bool, "Error: 'verbose' must be a boolean."
+    assert type(reverse_time) is bool, "Error: 'reverse_time' must be a boolean."
+    assert cache is None or cache is True or callable(cache), "Error: 'cache' must be True, a function or None."
+    assert type(max_workers) is int and max_workers > 0, "Error: 'max_workers' must be a positive integer."
+    assert type(incremental) is bool, "Error: 'incremental' must be a boolean."
+    assert not incremental or cache is True, "Error: 'incremental' requires cache=True."
+    return filter_pars, verbose, reverse_time, cache, max_workers, incremental
 
 
 def get_pars(code):
@@ -243,6 +983,20 @@ def get_dic(code, par=None, **kwargs):
     Return it as a Python list, a dataframe or a dictionary.
     """
 
+    frmt, full, lang = __get_dic_kwargs__(code, par, kwargs)
+
+    if par:
+        agencyId, provider, dims, __ = __get_dims_info__(code, detail='basic')
+        l = __get_codelist__(agencyId, provider, __get_par_id__(code, par, dims), lang)
+        if not full:
+            par_values = set(__get_constraint__(code).get(par.lower(), []))
+            l = [el for el in l if el[0] in par_values]
+    else:
+        __, __, l, __ = __get_dims_info__(code, detail='descr', lang=lang)
+    return __format_dic__(l, par, frmt)
+
+
+def __get_dic_kwargs__(code, par, kwargs):
     kwargs_opt = ["frmt", "full", "lang"]
     frmt_opt = ["list", "dict", "df"]
     lang_opt = ["en", "fr", "de"]
@@ -256,32 +1010,80 @@ def get_dic(code, par=None, **kwargs):
     assert frmt in frmt_opt, "Error: 'frmt' must be " + " or ".join(frmt_opt)
     assert type(full) is bool, "Error: 'full' must be a boolean."
     assert lang in lang_opt, "Error: 'lang' must be " + " or ".join(lang_opt)
-    
-    if par:    
-        agencyId, provider, dims, __ = __get_dims_info__(code, detail='basic')
-        try:
-            par_id = [d[1] for d in dims if d[0].lower() == par.lower()][0]
-        except:
-            print('Error: ' + par + ' not in ' + code)
-            raise
-        url = __Uri__.BASE_URL[provider] + "codelist/" + agencyId + \
-            "/"+ par_id + "/latest?format=TSV&compressed=true&lang=" + lang
-        resp = __get_resp__(url)
-        resp_list = decompress(resp.content).decode("utf-8").split("\r\n")
-        resp_list.pop()
-        tmp_list = [tuple(el.split("\t")) for el in resp_list]
-        if full:
-            l = tmp_list
-        else:
-            par_values = get_par_values(code, par)
-            l = [el for el in tmp_list if el[0] in par_values]
+    return frmt, full, lang
+
+
+def __get_par_id__(code, par, dims):
+    try:
+        return [d[1] for d in dims if d[0].lower() == par.lower()][0]
+    except:
+        print('Error: ' + par + ' not in ' + code)
+        raise
+
+
+def __get_codelist_url__(agencyId, provider, par_id, lang):
+    return __Uri__.BASE_URL[provider] + "codelist/" + agencyId + \
+        "/"+ par_id + "/latest?format=TSV&compressed=true&lang=" + lang
+
+
+def __get_codelist__(agencyId, provider, par_id, lang):
+    """
+    Get a codelist, shared by all the datasets that use it.
+    Return it as a list of tuples.
+    """
+
+    key = (agencyId, par_id, lang)
+    l = __load_codelist__(key)
+    if l is None:
+        l = __get_cond_resp__(__get_codelist_url__(agencyId, provider, par_id, lang),
+                              __parse_codelist__)
+        __cache_codelist__(key, l)
+    return l
+
+
+def __load_codelist__(key):
+    """
+    Return the codelist cached in memory for key (agencyId, codelist, lang),
+    or None if it is missing or older than metadata_max_age.
+    """
+
+    with __meta_lock__:
+        entry = __codelists__.get(key, None)
+        if entry is not None and time.time() - entry[0] > __ca__["metadata_max_age"]:
+            entry = None
+        if entry is not None:
+            __codelists__.move_to_end(key)
+    __emit__("cache", kind="codelist", key="/".join(key), hit=entry is not None)
+    return None if entry is None else entry[1]
+
+
+def __cache_codelist__(key, l):
+    with __meta_lock__:
+        __codelists__[key] = (time.time(), l)
+        __codelists__.move_to_end(key)
+        while len(__codelists__) > __ca__["metadata_size"]:
+            __codelists__.popitem(last=False)
+
+
+def __parse_codelist__(content):
+    """
+    Parse the gzipped TSV codelist.
+    """
+
+    resp_list = decompress(content).decode("utf-8").split("\r\n")
+    resp_list.pop()
+    return [tuple(el.split("\t")) for el in resp_list]
+
+
+def __format_dic__(l, par, frmt):
+    if par:
         columns = ['val', 'descr']
     else:
-        __, __, l, __ = __get_dims_info__(code, detail='descr', lang=lang)
         columns = ['dim', 'name', 'descr']
-    
+
     if frmt == "list":
-        return l
+        # a copy, since l can be shared by the cache of the codelists
+        return list(l)
     elif frmt == "dict":
         if par:
             return dict(l)
@@ -299,15 +1101,38 @@ def get_par_values(code, par):
     assert type(code) is str, "Error: 'code' must be a string."
     assert type(par) is str, "Error: 'par' must be a string."
     
-    agencyId, provider, __, __ = __get_dims_info__(code, detail='empty')
-    url = __Uri__.BASE_URL[provider] +\
+    return list(__get_constraint__(code).get(par.lower(), []))
+
+
+def __get_constraint__(code, meta=None):
+    """
+    Get the values of all the dimensions of a dataset in its content constraint.
+    It is cached with the metadata until the data of the dataset are updated.
+    Return a dict {dimension: list of values}.
+    """
+
+    if meta is None:
+        meta = __get_meta__(code, dims=False)
+    if meta.get("constraint", None) is None:
+        resp = __get_resp__(__get_constraint_url__(code, meta["agencyId"], meta["provider"]))
+        meta["constraint"] = __parse_constraint__(resp.content)
+        __save_meta__(code.upper(), meta)
+    return meta["constraint"]
+
+
+def __get_constraint_url__(code, agencyId, provider):
+    return __Uri__.BASE_URL[provider] +\
             "contentconstraint/" +\
             agencyId +\
             "/" +\
             code
-    resp = __get_resp__(url)
-    root = __get_xml_root__(resp)
-    return [v.text for p in root.findall(__Uri__.par_path) if p.get("id").lower() == par.lower() for v in p.findall(__Uri__.val_path)]
+
+
+def __parse_constraint__(content):
+    constraint = dict()
+    for __, p, __ in __iter_xml__(content, [__Uri__.par_path]):
+        constraint.setdefault(p.get("id").lower(), []).extend(v.text for v in p.findall(__Uri__.val_path))
+    return constraint
 
 
 def get_toc(**kwargs):
@@ -322,68 +1147,11 @@ def get_toc(**kwargs):
         ", ".join(list(set(kwargs).difference(kwargs_opt)))
     dataset = kwargs.get('dataset', 'all')
     lang = kwargs.get('lang', 'en')
-    done = False
-    
-    toc = [("title",
-            "code",
-            "type",
-            "last update of data",
-            "last table structure change",
-            "data start",
-            "data end",
-            # "agencyId"
-            ), ]
-    for prov in __Uri__.BASE_URL:
-        base_url = __Uri__.BASE_URL[prov]
-        if dataset == 'all':
-            url = base_url +\
-                    "dataflow/all?format=JSON&compressed=true&lang=" +\
-                    lang
-        else:
-            url = base_url +\
-                    "dataflow/" +\
-                    dict(__agency_by_provider__)[prov] +\
-                    "/" +\
-                    dataset +\
-                    "?format=JSON&compressed=true&lang=" +\
-                    lang
-        resp = __get_resp__(url)
-        if resp.ok:
-            resp_txt = decompress(resp.content).decode("utf-8")
-            resp_dict = json.loads(resp_txt)
-            if dataset == 'all':
-                content = resp_dict["link"]["item"]
-            else:
-                content = [resp_dict,]
-                done = True
-            for el in content:
-                title = el["label"]
-                code = el["extension"]["id"]
-                _type = el["class"]
-                data_start = None
-                data_end = None
-                for a in el["extension"]["annotation"]:
-                    if a["type"] == "UPDATE_DATA":
-                        last_update = a["date"]
-                    elif a["type"] == "UPDATE_STRUCTURE":
-                        last_struct_change = a["date"]
-                    elif a["type"] == "OBS_PERIOD_OVERALL_OLDEST":
-                        data_start = a["title"]
-                    elif a["type"] == "OBS_PERIOD_OVERALL_LATEST":
-                        data_end = a["title"]
-                # agencyId = el["extension"]["agencyId"]
-                toc.append((title,
-                            code,
-                            _type,
-                            last_update,
-                            last_struct_change,
-                            data_start,
-                            data_end,
-                            # agencyId
-                            ))
-            if done:
-                break
-    return toc
+
+    provs = __get_toc_provs__(dataset)
+    with ThreadPoolExecutor(max_workers=len(provs)) as executor:
+        parts = list(executor.map(lambda prov: __get_toc_part__(prov, dataset, lang), provs))
+    return __merge_toc__(provs, parts, dataset, lang)
 
 
 def get_toc_df(**kwargs):
@@ -407,6 +1175,257 @@ def subset_toc_df(toc_df, keyword):
     return toc_df[toc_df["title"].str.contains(keyword, case=False)]
 
 
+def search_toc(keywords, **kwargs):
+    """
+    Search the Eurostat table of contents for the datasets whose title or code
+    contain words starting with all the given keywords.
+    The table of contents is downloaded only if the local copy
+    is older than toc_max_age (see set_cache_args).
+    lang can be 'en'', 'fr', 'de'.
+    Return a list of tuples. The first element of the list contains the header line.
+    """
+
+    kwargs_opt = ['lang']
+    assert set(kwargs.keys()).issubset(kwargs_opt), "Argument not allowed: " + \
+        ", ".join(list(set(kwargs).difference(kwargs_opt)))
+    lang = kwargs.get('lang', 'en')
+    assert type(keywords) is str or (type(keywords) is list and all(type(k) is str for k in keywords)),\
+        "Error: 'keywords' must be a string or a list of strings."
+    if type(keywords) is str:
+        keywords = [keywords, ]
+
+    index = __get_toc_index__(lang)
+    rows = None
+    for word in __get_toc_tokens__(" ".join(keywords)):
+        i = bisect_left(index["tokens"], word)
+        found = set()
+        while i < len(index["tokens"]) and index["tokens"][i].startswith(word):
+            found.update(index["postings"][index["tokens"][i]])
+            i += 1
+        rows = found if rows is None else rows.intersection(found)
+        if not rows:
+            break
+    return index["toc"][:1] + [index["toc"][r] for r in sorted(rows or [])]
+
+
+def search_toc_df(keywords, **kwargs):
+    """
+    Search the Eurostat table of contents, as search_toc.
+    Return a pandas dataframe.
+    """
+
+    t = search_toc(keywords, **kwargs)
+
+    return DataFrame(t[1:], columns=t[0])
+
+
+def __get_toc_part__(prov, dataset, lang):
+    """
+    Return the table of contents of a provider, or None.
+    The full one is asked with the validators of the previous response.
+    """
+
+    url = __get_toc_url__(prov, dataset, lang)
+    if dataset == 'all':
+        return __get_cond_resp__(url, lambda content: __parse_toc_content__(content, dataset), False)
+    resp = __get_resp__(url, is_raise=False)
+    if resp is None or not resp.ok:
+        return None
+    return __parse_toc_content__(resp.content, dataset)
+
+
+def __parse_toc_content__(content, dataset):
+    resp_dict = json.loads(decompress(content).decode("utf-8"))
+    if dataset == 'all':
+        return __parse_toc__(resp_dict["link"]["item"])
+    else:
+        return __parse_toc__([resp_dict,])
+
+
+def __get_toc_url__(prov, dataset, lang):
+    base_url = __Uri__.BASE_URL[prov]
+    if dataset == 'all':
+        return base_url +\
+                "dataflow/all?format=JSON&compressed=true&lang=" +\
+                lang
+    else:
+        return base_url +\
+                "dataflow/" +\
+                dict(__agency_by_provider__)[prov] +\
+                "/" +\
+                dataset +\
+                "?format=JSON&compressed=true&lang=" +\
+                lang
+
+
+def __get_toc_provs__(dataset):
+    """
+    Return the providers to ask for the table of contents.
+    """
+
+    if dataset == 'all':
+        return list(__Uri__.BASE_URL)
+    known = __get_provider_index__().get(dataset.upper(), None)
+    return [known, ] if known else list(__Uri__.BASE_URL)
+
+
+def __merge_toc__(provs, parts, dataset, lang):
+    """
+    Join the tables of contents of provs
+    (None if a provider did not answer).
+    The full table of contents is also saved for search_toc.
+    """
+
+    toc = [("title",
+            "code",
+            "type",
+            "last update of data",
+            "last table structure change",
+            "data start",
+            "data end",
+            # "agencyId"
+            ), ]
+    for prov, prov_toc in zip(provs, parts):
+        if prov_toc is not None:
+            __update_provider_index__(dict((el[1].upper(), prov) for el in prov_toc))
+            toc.extend(prov_toc)
+            if dataset != 'all':
+                break
+    if dataset == 'all':
+        __save_toc_index__(lang, toc)
+    return toc
+
+
+def __parse_toc__(content):
+    toc = []
+    for el in content:
+        title = el["label"]
+        code = el["extension"]["id"]
+        _type = el["class"]
+        last_update = None
+        last_struct_change = None
+        data_start = None
+        data_end = None
+        for a in el["extension"]["annotation"]:
+            if a["type"] == "UPDATE_DATA":
+                last_update = a["date"]
+            elif a["type"] == "UPDATE_STRUCTURE":
+                last_struct_change = a["date"]
+            elif a["type"] == "OBS_PERIOD_OVERALL_OLDEST":
+                data_start = a["title"]
+            elif a["type"] == "OBS_PERIOD_OVERALL_LATEST":
+                data_end = a["title"]
+        # agencyId = el["extension"]["agencyId"]
+        toc.append((title,
+                    code,
+                    _type,
+                    last_update,
+                    last_struct_change,
+                    data_start,
+                    data_end,
+                    # agencyId
+                    ))
+    return toc
+
+
+def __get_toc_tokens__(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def __get_toc_index__(lang):
+    """
+    Return the table of contents in lang, with its inverted index:
+    "tokens" is the sorted list of the words in titles and codes,
+    "postings" maps each word to the rows where it is found.
+    The table of contents is read from memory or from metadata_dir,
+    or downloaded if it is older than toc_max_age.
+    """
+
+    with __meta_lock__:
+        index = __toc_indexes__.get(lang, None)
+    if index is None and __ca__["metadata_dir"] is not None:
+        try:
+            with open(path.join(__ca__["metadata_dir"], "__toc_" + lang + "__.json"), encoding="utf-8") as f:
+                saved = json.load(f)
+            index = __build_toc_index__([tuple(el) for el in saved["toc"]], saved["checked"])
+            with __meta_lock__:
+                __toc_indexes__[lang] = index
+        except (OSError, ValueError, KeyError):
+            index = None
+    if index is None or time.time() - index["checked"] > __ca__["toc_max_age"]:
+        get_toc(lang=lang)
+        with __meta_lock__:
+            index = __toc_indexes__[lang]
+    return index
+
+
+def __build_toc_index__(toc, checked):
+    postings = dict()
+    for i, el in enumerate(toc[1:], start=1):
+        code = el[1].lower()
+        for word in set(__get_toc_tokens__(el[0]) + [code, ] + code.split("_")):
+            postings.setdefault(word, []).append(i)
+    return {"toc": toc,
+            "checked": checked,
+            "tokens": sorted(postings),
+            "postings": postings}
+
+
+def __save_toc_index__(lang, toc):
+    checked = time.time()
+    index = __build_toc_index__(toc, checked)
+    with __meta_lock__:
+        __toc_indexes__[lang] = index
+        if __ca__["metadata_dir"] is not None:
+            makedirs(__ca__["metadata_dir"], exist_ok=True)
+            fname = path.join(__ca__["metadata_dir"], "__toc_" + lang + "__.json")
+            with open(fname + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"checked": checked, "toc": toc}, f)
+            replace(fname + ".tmp", fname)
+
+
+def __get_provider_index__():
+    """
+    Return the dict {dataset code: provider} learnt from the table of contents.
+    """
+
+    with __meta_lock__:
+        if not __provider_index__ and __ca__["metadata_dir"] is not None:
+            try:
+                with open(path.join(__ca__["metadata_dir"], "__providers__.json"), encoding="utf-8") as f:
+                    __provider_index__.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+        return dict(__provider_index__)
+
+
+def __update_provider_index__(index):
+    """
+    Add the providers of index to the index in memory and in metadata_dir.
+    The file is written only if something is new, merged with its current
+    content (another process can share metadata_dir), and replaced at once.
+    """
+
+    with __meta_lock__:
+        new = dict((k, index[k]) for k in index if __provider_index__.get(k, None) != index[k])
+        if new == dict():
+            return
+        __provider_index__.update(new)
+        if __ca__["metadata_dir"] is not None:
+            makedirs(__ca__["metadata_dir"], exist_ok=True)
+            fname = path.join(__ca__["metadata_dir"], "__providers__.json")
+            try:
+                with open(fname, encoding="utf-8") as f:
+                    saved = json.load(f)
+            except (OSError, ValueError):
+                saved = dict()
+            saved.update(__provider_index__)
+            tmp = __get_tmp_name__(fname)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(saved, f)
+            replace(tmp, fname)
+
+
 def __get_dims_info__(code, **kwargs):
     """
     if detail == 'descr' : dims = [(codelist_name, full_name, description), ...]
@@ -419,76 +1438,313 @@ def __get_dims_info__(code, **kwargs):
     assert set(kwargs.keys()), 'Wrong kwargs'
     detail = kwargs.get('detail', None)
     lang = kwargs.get('lang', 'en')
-    
-    # retrieve agencyId, provider, df_root, dsd_root
-    found = False
-    i = 0
-    df_tail = "/latest?detail=referencepartial&references=descendants" if detail == 'descr' else \
-                "/latest"
-    while (not found) and (i <= len(__agency_by_provider__)):
-        try:
-            df_url = __Uri__.BASE_URL[__agency_by_provider__[i][0]] +\
-                    "dataflow/" +\
-                    __agency_by_provider__[i][1] +\
-                    "/" +\
-                    code +\
-                    df_tail
-            resp = __get_resp__(df_url, is_raise=False)
-            df_root = __get_xml_root__(resp)
-            agencyId = __agency_by_provider__[i][1]
-            provider = __agency_by_provider__[i][0]
-            dsd_last_update = df_root.find(__Uri__.dsd_update_data_path).text
-            if detail == 'empty':
-                return [agencyId, provider, [], dsd_last_update]
-            found = True
-        except:
-            pass
-        i += 1
-    if not found:
-        print("Dataset not found: " + code)
-        raise ValueError
-    else:
-        dsd_code = df_root.find(__Uri__.dsd_path).get("id")
-        dsd_last_update = df_root.find(__Uri__.dsd_update_data_path).text
-    dsd_url = __Uri__.BASE_URL[provider] +\
-                "datastructure/" +\
-                agencyId +\
-                "/" +\
-                dsd_code +\
-                "/latest"
-    resp = __get_resp__(dsd_url)
-    dsd_root = __get_xml_root__(resp)
 
-    # get dims
+    meta = __get_meta__(code,
+                        dims=(detail != 'empty'),
+                        lang=(lang if detail == 'descr' else None))
+    return [meta["agencyId"], meta["provider"], __format_dims__(meta, detail, lang), meta["update_data"]]
+
+
+def __format_dims__(meta, detail, lang):
     if detail == 'name':
-        dims = [dim.get("id")
-                 for dim in dsd_root.findall(__Uri__.dim_path)]
+        dims = [dim[0] for dim in meta["dims"]]
     elif detail == 'basic':
-        dims = [(dim.get("id"), dim.find(__Uri__.ref_path).get("id"))
-                 for dim in dsd_root.findall(__Uri__.dim_path)]
+        dims = [(dim[0], dim[2]) for dim in meta["dims"]]
     elif detail == 'order':
-        dims = [(dim.get("position"), dim.get("id"))
-                 for dim in dsd_root.findall(__Uri__.dim_path)]
+        dims = [(dim[1], dim[0]) for dim in meta["dims"]]
     elif detail == 'descr':
-        descr = df_root.findall(__Uri__.codelist_path)
+        dims = [tuple(dim) for dim in meta["descr"][lang]]
+    else:
         dims = []
-        for dim1 in dsd_root.findall(__Uri__.dim_path):
-            dimension_ID = dim1.find(__Uri__.ref_path).get("id")
-            for dim in descr:
-                if dim.get("id") == dimension_ID:
-                    full_name = None
-                    for d in dim.findall(__Uri__.XMLSNS_C + 'Name'):
-                        if d.get(__Uri__.XMLSNS_L, None) == lang:
-                            full_name = d.text
-                    if full_name == None:
-                        full_name = dim.findtext(__Uri__.XMLSNS_C + 'Name')
-                    description = dim.findtext(__Uri__.XMLSNS_C + 'Description')
-                    break
-            dims.append((dim1.get("id"),
-                         full_name,
-                         description))
-
-    return [agencyId, provider, dims, dsd_last_update]
+    return dims
+
+
+def __get_meta__(code, **kwargs):
+    """
+    Resolve provider, agencyId, last updates, dimensions of the DSD and,
+    if lang is given, the descriptions of the dimensions.
+    The result is cached and refreshed when the dataset structure changes.
+    """
+
+    need_dims = kwargs.get("dims", True)
+    lang = kwargs.get("lang", None)
+    key = code.upper()
+    meta = __load_meta__(key)
+    is_valid = __is_meta_valid__(meta, need_dims, lang)
+    __emit__("cache", kind="metadata", key=key, hit=is_valid)
+    if is_valid:
+        return meta
+
+    df_tail = __get_df_tail__(lang)
+    df_info = None
+    if meta is not None:
+        df_info = __get_df_info__(code, meta["provider"], meta["agencyId"], df_tail)
+    if df_info is None:
+        meta = None
+        found = __find_provider__(code, df_tail)
+        if found is not None:
+            meta = __new_meta__(found[0], found[1])
+            df_info = found[2]
+    if df_info is None:
+        print("Dataset not found: " + code)
+        raise ValueError
+    codelists = __set_df_info__(meta, df_info)
+    if (need_dims or lang) and meta["dims"] is None:
+        meta["dims"] = __get_cond_resp__(__get_dsd_url__(meta), __parse_dims__)
+    return __finish_meta__(key, meta, codelists, lang)
+
+
+def __is_meta_valid__(meta, need_dims, lang):
+    return meta is not None and\
+           time.time() - meta["checked"] <= __ca__["metadata_max_age"] and\
+           (meta["dims"] is not None or not need_dims) and\
+           (lang is None or lang in meta["descr"])
+
+
+def __get_df_tail__(lang):
+    return "/latest?detail=referencepartial&references=descendants" if lang else \
+            "/latest"
+
+
+def __new_meta__(provider, agencyId):
+    return {"provider": provider,
+            "agencyId": agencyId,
+            "dsd_code": None,
+            "update_structure": None,
+            "dims": None,
+            "descr": dict(),
+            "constraint": None}
+
+
+def __set_df_info__(meta, df_info):
+    """
+    Update meta with the dataflow info. The dimensions are dropped
+    if the structure of the dataset has changed.
+    Return the names of the codelists in the dataflow.
+    """
+
+    codelists, dsd_code, update_data, update_structure = df_info
+    if meta["dsd_code"] != dsd_code or meta["update_structure"] != update_structure:
+        meta["dsd_code"] = dsd_code
+        meta["update_structure"] = update_structure
+        meta["dims"] = None
+        meta["descr"] = dict()
+    if meta.get("update_data", None) != update_data:
+        meta["constraint"] = None
+    meta["update_data"] = update_data
+    return codelists
+
+
+def __get_dsd_url__(meta):
+    return __Uri__.BASE_URL[meta["provider"]] +\
+            "datastructure/" +\
+            meta["agencyId"] +\
+            "/" +\
+            meta["dsd_code"] +\
+            "/latest"
+
+
+def __parse_dims__(content):
+    return [(dim.get("id"), dim.get("position"), dim.find(__Uri__.ref_path).get("id"))
+            for __, dim, __ in __iter_xml__(content, [__Uri__.dim_path])]
+
+
+def __iter_xml__(content, paths):
+    """
+    Parse an XML message incrementally.
+    Yield (path, element, open parents) for each element whose path
+    from the root is in paths, as soon as it is complete.
+    Every element is dropped when it ends, unless it is in one of those,
+    so that the memory does not grow with the size of the message.
+    """
+
+    parents = []
+    parent_paths = []
+    n_kept = 0
+    for event, elem in ET.iterparse(BytesIO(content), events=("start", "end")):
+        if event == "start":
+            if not parent_paths:
+                elem_path = ""
+            elif not parent_paths[-1]:
+                elem_path = elem.tag
+            else:
+                elem_path = parent_paths[-1] + "/" + elem.tag
+            parents.append(elem)
+            parent_paths.append(elem_path)
+            if elem_path in paths:
+                n_kept += 1
+        else:
+            parents.pop()
+            elem_path = parent_paths.pop()
+            if elem_path in paths:
+                n_kept -= 1
+                yield elem_path, elem, parents
+            if n_kept == 0 and parents:
+                del parents[-1][-1]
+
+
+def __finish_meta__(key, meta, codelists, lang):
+    if lang and lang not in meta["descr"]:
+        meta["descr"][lang] = __get_descr__(codelists, meta["dims"], lang)
+    meta["checked"] = time.time()
+    __save_meta__(key, meta)
+    return meta
+
+
+def __find_provider__(code, df_tail):
+    """
+    Look for the dataflow of code in all the providers at the same time,
+    after the provider learnt from the table of contents, if any.
+    Return [provider, agencyId, df_info] of the first provider that has it,
+    in the order of __Uri__.BASE_URL (not of the answers), or None.
+    If no provider has it and some of them did not answer,
+    the last error is raised instead.
+    """
+
+    agencies = dict(__agency_by_provider__)
+    known = __get_provider_index__().get(code.upper(), None)
+    error = None
+    if known is not None:
+        try:
+            df_info = __get_df_info__(code, known, agencies[known], df_tail)
+        except Exception as e:
+            df_info = None
+            error = e
+        if df_info is not None:
+            return [known, agencies[known], df_info]
+    executor = ThreadPoolExecutor(max_workers=len(__agency_by_provider__))
+    probes = [(provider, agencies[provider],
+               executor.submit(__get_df_info__, code, provider, agencies[provider], df_tail))
+              for provider in __Uri__.BASE_URL
+              if provider in agencies and provider != known]
+    try:
+        for provider, agencyId, fut in probes:
+            try:
+                df_info = fut.result()
+            except Exception as e:
+                error = e
+                continue
+            if df_info is not None:
+                __update_provider_index__({code.upper(): provider})
+                return [provider, agencyId, df_info]
+    finally:
+        for __, __, fut in probes:
+            fut.cancel()
+        executor.shutdown(wait=False)
+    if error is not None:
+        raise error
+    return None
+
+
+def __get_df_info__(code, provider, agencyId, df_tail):
+    """
+    Return the info of the dataflow of code in provider, or None if the
+    provider does not have it (status 404). The other errors are raised.
+    """
+
+    resp = __get_raw_resp__(__get_df_url__(code, provider, agencyId, df_tail), True)
+    if resp.status_code == 404 or (resp.ok and b"<S:Fault" in resp.content):
+        return None
+    resp.raise_for_status()
+    return __parse_df_info__(resp.content)
+
+
+def __get_df_url__(code, provider, agencyId, df_tail):
+    return __Uri__.BASE_URL[provider] +\
+            "dataflow/" +\
+            agencyId +\
+            "/" +\
+            code +\
+            df_tail
+
+
+def __parse_df_info__(content):
+    """
+    Parse the dataflow, keeping only the DSD code, the last updates
+    and the names of the codelists.
+    Return [codelists, dsd_code, update_data, update_structure], where
+    codelists = {codelist_id: [[(lang, name), ...], description]},
+    or None if it is not a dataflow.
+    """
+
+    codelists = dict()
+    annotations = dict()
+    dsd_code = None
+    paths = [__Uri__.dsd_path, __Uri__.dsd_annotation_path,
+             __Uri__.codelist_name_path, __Uri__.codelist_descr_path]
+    try:
+        for elem_path, elem, parents in __iter_xml__(content, paths):
+            if elem_path == __Uri__.dsd_path:
+                if dsd_code is None:
+                    dsd_code = elem.get("id")
+            elif elem_path == __Uri__.dsd_annotation_path:
+                ann_type = elem.findtext(__Uri__.XMLSNS_C + "AnnotationType")
+                if ann_type not in annotations:
+                    annotations[ann_type] = elem.findtext(__Uri__.XMLSNS_C + "AnnotationTitle")
+            else:
+                cl = codelists.setdefault(parents[-1].get("id"), [[], None])
+                if elem_path == __Uri__.codelist_name_path:
+                    cl[0].append((elem.get(__Uri__.XMLSNS_L, None), elem.text or ""))
+                elif cl[1] is None:
+                    cl[1] = elem.text or ""
+    except ET.ParseError:
+        return None
+    if dsd_code is None or annotations.get("UPDATE_DATA", None) is None:
+        return None
+    return [codelists, dsd_code, annotations["UPDATE_DATA"], annotations.get("UPDATE_STRUCTURE", None)]
+
+
+def __get_descr__(codelists, dims, lang):
+    dims_descr = []
+    for dim in dims:
+        full_name = None
+        description = None
+        if dim[2] in codelists:
+            names, description = codelists[dim[2]]
+            for name_lang, name in names:
+                if name_lang == lang:
+                    full_name = name
+            if full_name is None and names:
+                full_name = names[0][1]
+        dims_descr.append((dim[0],
+                           full_name,
+                           description))
+    return dims_descr
+
+
+def __load_meta__(key):
+    with __meta_lock__:
+        meta = __meta_cache__.get(key, None)
+        if meta is not None:
+            __meta_cache__.move_to_end(key)
+    if meta is None and __ca__["metadata_dir"] is not None:
+        try:
+            with open(path.join(__ca__["metadata_dir"], key + ".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        __cache_meta__(key, meta)
+    if meta is None:
+        return None
+    return dict(meta, descr=dict(meta["descr"]))
+
+
+def __save_meta__(key, meta):
+    __cache_meta__(key, meta)
+    if __ca__["metadata_dir"] is not None:
+        makedirs(__ca__["metadata_dir"], exist_ok=True)
+        fname = path.join(__ca__["metadata_dir"], key + ".json")
+        with open(fname + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        replace(fname + ".tmp", fname)
+
+
+def __cache_meta__(key, meta):
+    with __meta_lock__:
+        __meta_cache__[key] = meta
+        __meta_cache__.move_to_end(key)
+        while len(__meta_cache__) > __ca__["metadata_size"]:
+            __meta_cache__.popitem(last=False)
 
 
 def __get_xml_root__(resp):
@@ -499,34 +1755,304 @@ def __get_xml_root__(resp):
     return root
 
 
-def __get_raw_resp__(url, is_raise):
-    is_ok = False
-    max_att = 4
+def __get_provider__(url):
+    for prov in __Uri__.BASE_URL:
+        if url.startswith(__Uri__.BASE_URL[prov]) or\
+           url.startswith(__Uri__.BASE_ASYNC_URL[prov]):
+            return prov
+    return None
+
+
+def __get_session__(url):
+    prov = __get_provider__(url)
+    with __sessions_lock__:
+        if prov not in __sessions__:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2,
+                                  pool_maxsize=__sa__["pool_maxsize"],
+                                  max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if not __sa__["keep_alive"]:
+                session.headers["Connection"] = "close"
+            __sessions__[prov] = session
+        return __sessions__[prov]
+
+
+def __close_sessions__():
+    with __sessions_lock__:
+        for prov in list(__sessions__):
+            __sessions__.pop(prov).close()
+
+
+def __get_raw_resp__(url, is_raise, stream=False, headers=None):
+    """
+    Get url, retrying with exponential backoff after a connection error,
+    a "sorry" page or a status 408, 429 or 5xx.
+    Other 4xx responses are returned at once.
+    Return the response, or None if is_raise is False and there is none.
+    """
+
+    prov = __get_provider__(url)
     n_att = 0
-    # print(url)
-    while (not is_ok) and (n_att != max_att):
-        n_att += 1
+    while True:
+        if not __check_breaker__(prov, is_raise):
+            return None
+        resp = None
+        last_exception = None
+        limiter = __get_limiter__(url)
+        __acquire__(limiter)
+        start = time.time()
         try:
-            resp = requests.get(url,  **__ra__)
-            is_ok = resp.ok
+            resp = __get_session__(url).get(url, stream=stream, headers=headers, **__ra__)
         except Exception as e:
             last_exception = e
-    if "resp" not in locals():
-        if is_raise:
-            raise last_exception
-        else:
-            resp = None
-    elif resp.url == "https://sorry.ec.europa.eu/":
+        finally:
+            # a streamed body keeps its slot until it is read or closed
+            if resp is not None and stream:
+                __hold_slot__(resp, limiter)
+            else:
+                __release__(limiter)
+        is_sorry = resp is not None and resp.url == "https://sorry.ec.europa.eu/"
+        status = None if resp is None or is_sorry else resp.status_code
+        is_retry = __is_retry__(status) and n_att < __sa__["max_retries"]
+        wait = __get_retry_wait__(n_att + 1, None if resp is None else resp.headers.get("Retry-After"))\
+            if is_retry else None
+        is_too_long = is_retry and wait is None
+        is_retry = is_retry and not is_too_long
+        __emit__("request", url=url, provider=prov, status=status,
+                 bytes=__get_resp_size__(resp, stream), attempt=n_att,
+                 retry=is_retry, duration=time.time() - start)
+        if not is_retry:
+            break
+        if resp is not None:
+            resp.close()
+        n_att += 1
+        time.sleep(wait)
+    __update_breaker__(prov, status)
+    if is_sorry:
+        resp.close()
         print("Server inaccessibility\n")
         print("The server is temporarily unavailable\n")
+        raise ConnectionError("The server is temporarily unavailable")
+    if is_too_long:
+        resp.close()
+        if is_raise:
+            print("Server inaccessibility: " + str(prov) + " asks to retry after more than " +
+                  str(__sa__["retry_after_max"]) + " sec. Try again later.\n")
+            resp.raise_for_status()
+        return None
+    if resp is None and is_raise:
         raise last_exception
     return resp
 
 
+def __hold_slot__(resp, limiter):
+    """
+    Release the in-flight slot of limiter taken by the streamed resp
+    only when its body is read to the end or resp is closed.
+    """
+
+    held = [True]
+
+    def release():
+        with limiter["cond"]:
+            if held[0]:
+                held[0] = False
+                __release__(limiter)
+
+    iter_content = resp.iter_content
+    close = resp.close
+
+    def iter_and_release(*args, **kwargs):
+        try:
+            for chunk in iter_content(*args, **kwargs):
+                yield chunk
+        finally:
+            release()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            release()
+
+    resp.iter_content = iter_and_release
+    resp.close = close_and_release
+
+
+def __get_resp_size__(resp, stream):
+    if resp is None:
+        return 0
+    if stream:
+        try:
+            return int(resp.headers.get("Content-Length", 0))
+        except ValueError:
+            return 0
+    return len(resp.content)
+
+
+def __get_limiter__(url):
+    """
+    Return the limiter of the base URL of url,
+    in __Uri__.BASE_URL or __Uri__.BASE_ASYNC_URL.
+    """
+
+    base = None
+    for prov in __Uri__.BASE_URL:
+        for b in [__Uri__.BASE_URL[prov], __Uri__.BASE_ASYNC_URL[prov]]:
+            if url.startswith(b):
+                base = b
+    with __limiters_lock__:
+        if base not in __limiters__:
+            __limiters__[base] = {"cond": threading.Condition(),
+                                  "tokens": float(__sa__["rate_burst"]),
+                                  "last": time.time(),
+                                  "in_flight": 0,
+                                  "waiters": []}
+        return __limiters__[base]
+
+
+def __try_acquire__(limiter):
+    """
+    Take a token from the bucket of the limiter (filled at rate_limit per sec,
+    up to rate_burst) and a slot among max_in_flight, if both are available.
+    Return None if they are taken, -1 if all the slots are busy,
+    otherwise the seconds to wait for the next token.
+    Must be called holding limiter["cond"].
+    """
+
+    now = time.time()
+    rate = __sa__["rate_limit"]
+    if rate is not None:
+        limiter["tokens"] = min(float(__sa__["rate_burst"]),
+                                limiter["tokens"] + (now - limiter["last"]) * rate)
+    limiter["last"] = now
+    if __sa__["max_in_flight"] is not None and limiter["in_flight"] >= __sa__["max_in_flight"]:
+        return -1.
+    if rate is not None and limiter["tokens"] < 1.:
+        return (1. - limiter["tokens"]) / rate
+    if rate is not None:
+        limiter["tokens"] -= 1.
+    limiter["in_flight"] += 1
+    return None
+
+
+def __acquire__(limiter):
+    with limiter["cond"]:
+        wait = __try_acquire__(limiter)
+        while wait is not None:
+            limiter["cond"].wait(wait if wait >= 0 else None)
+            wait = __try_acquire__(limiter)
+
+
+def __release__(limiter):
+    """
+    Free a slot of the limiter, and wake a thread and an asyncio task
+    waiting for it (the waiters are futures of __acquire_async__).
+    """
+
+    with limiter["cond"]:
+        limiter["in_flight"] -= 1
+        limiter["cond"].notify()
+        while limiter["waiters"]:
+            loop, waiter = limiter["waiters"].pop(0)
+            try:
+                loop.call_soon_threadsafe(__wake__, waiter)
+                break
+            except RuntimeError:
+                # the event loop is closed
+                continue
+
+
+def __wake__(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def __is_retry__(status):
+    """
+    status is None after a connection error or a "sorry" page.
+    """
+
+    return status is None or status in [408, 429] or status >= 500
+
+
+def __get_retry_wait__(n_att, retry_after):
+    """
+    Return the seconds to wait before the attempt n_att + 1:
+    the Retry-After header if given, otherwise an exponential backoff
+    with jitter.
+    Return None if Retry-After is longer than retry_after_max.
+    """
+
+    wait = None
+    if retry_after is not None:
+        try:
+            wait = max(float(retry_after), 0.)
+        except ValueError:
+            try:
+                wait = max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.)
+            except (TypeError, ValueError, OverflowError):
+                pass
+    if wait is not None:
+        return wait if wait <= __sa__["retry_after_max"] else None
+    return random.uniform(0., min(__sa__["backoff_max"], __sa__["backoff_factor"] * 2 ** (n_att - 1)))
+
+
+def __check_breaker__(prov, is_raise):
+    """
+    Fail fast while the circuit breaker of the provider is open.
+    Return False (or raise, if is_raise) if it is open, True otherwise.
+    """
+
+    with __breakers_lock__:
+        breaker = __breakers__.get(prov, None)
+        if breaker is None or breaker["open_until"] <= time.time():
+            return True
+    if is_raise:
+        print("Server inaccessibility: " + str(prov) + " does not answer. Try again later.\n")
+        raise ConnectionError("Circuit breaker open for " + str(prov))
+    return False
+
+
+def __update_breaker__(prov, status):
+    """
+    Count the consecutive failed requests to the provider: after
+    breaker_threshold of them, the breaker is open for breaker_timeout sec.
+    A request after that time closes it if it succeeds, otherwise
+    the breaker is open again.
+    """
+
+    with __breakers_lock__:
+        breaker = __breakers__.setdefault(prov, {"failures": 0, "open_until": 0.})
+        if status is not None and status < 500:
+            breaker["failures"] = 0
+            breaker["open_until"] = 0.
+        else:
+            breaker["failures"] += 1
+            if breaker["failures"] >= __sa__["breaker_threshold"]:
+                breaker["open_until"] = time.time() + __sa__["breaker_timeout"]
+
+
 def __get_resp__(url,**kwargs):
-    assert set(kwargs.keys()).issubset(['provider', 'is_raise'])
+    assert set(kwargs.keys()).issubset(['provider', 'is_raise', 'stream', 'chunk_size', 'headers'])
     is_raise = kwargs.get("is_raise", True)
-    resp = __get_raw_resp__(url, is_raise)
+    stream = kwargs.get("stream", False)
+    resp = __get_raw_resp__(url, is_raise, stream, kwargs.get("headers", None))
+    if resp is not None and stream:
+        # gzipped data are returned as a stream in resp.chunks,
+        # the XML messages are read at once
+        chunks = resp.iter_content(kwargs.get("chunk_size", 1 << 16))
+        first = b""
+        for chunk in chunks:
+            first += chunk
+            if len(first) >= 2:
+                break
+        if first[:2] == b"\x1f\x8b":
+            resp.chunks = chain([first, ], chunks)
+            return resp
+        resp._content = first + b"".join(chunks)
     if resp is not None:
         if b"<S:Fault" in resp.content:
             if resp.ok:
@@ -540,41 +2066,546 @@ def __get_resp__(url,**kwargs):
                 else:
                     resp = None
         elif b"status></" in resp.content:
-            root = __get_xml_root__(resp)
-            try:
-                status = root.find(__Uri__.async_status_path).text
-            except:
-                try:
-                    status = root.find(__Uri__.sync_status_path).text
-                except:
-                    print('Unexpected error: Status path not found.')
-                    raise ConnectionError
-            try:
-                key = root.find(__Uri__.async_key_path).text
-            except:
-                try:
-                    key = root.find(__Uri__.sync_key_path).text
-                except:
-                    print('Unexpected error: Key path not found.')
-                    raise ConnectionError
-            async_status_url = __Uri__.BASE_ASYNC_URL[kwargs["provider"]] +\
-                                "status/" +\
-                                key
-            while status != "AVAILABLE":
-                resp = __get_raw_resp__(async_status_url, True)
-                root = __get_xml_root__(resp)
-                status = root.find(__Uri__.async_status_path).text
-                if status in ["EXPIRED", "UNKNOWN_REQUEST"]:
-                    raise ConnectionError
-                elif status not in ["SUBMITTED", "PROCESSING", "AVAILABLE"]:
-                    print("Unexpected async status: " + status + " Try again.")
-                    raise ConnectionError
-            resp = __get_resp__(async_status_url.replace("/status/","/data/"))
+            status, key = __get_async_key__(__get_xml_root__(resp))
+            if status == "AVAILABLE":
+                data_url = __Uri__.BASE_ASYNC_URL[kwargs["provider"]] + "data/" + key
+            else:
+                data_url = __submit_job__(kwargs["provider"], key).result(__sa__["poll_timeout"])
+            resp = __get_resp__(data_url, stream=stream,
+                                chunk_size=kwargs.get("chunk_size", 1 << 16))
     return resp
 
-def __get_data__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update):
+
+def __get_cond_resp__(url, parse, is_raise=True):
+    """
+    Get url sending the validators (ETag, Last-Modified) of the previous
+    response, if any.
+    Return parse(content), or the result saved with the validators
+    if the server answers 304 Not Modified.
+    An error response is never parsed nor saved: it is raised if is_raise,
+    otherwise None is returned.
+    """
+
+    entry, headers = __get_validators__(url)
+    resp = __get_resp__(url, is_raise=is_raise, headers=headers)
+    if resp is None:
+        return None
+    if entry is not None:
+        __emit__("cache", kind="http", key=url, hit=resp.status_code == 304)
+    if resp.status_code == 304 and entry is not None:
+        return entry["result"]
+    if not resp.ok or resp.status_code == 304:
+        if is_raise:
+            resp.raise_for_status()
+        return None
+    result = parse(resp.content)
+    __save_validators__(url, resp.headers, result)
+    return result
+
+
+def __get_validators__(url):
+    """
+    Return the saved entry of url, with the validators and the parsed result,
+    and the headers of a conditional request.
+    """
+
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    with __meta_lock__:
+        entry = __validators__.get(key, None)
+        if entry is not None:
+            __validators__.move_to_end(key)
+    if entry is None and __ca__["metadata_dir"] is not None:
+        try:
+            with open(path.join(__ca__["metadata_dir"], "__http__", key + ".json"), encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["result"] = [tuple(el) for el in entry["result"]]
+        except (OSError, ValueError, KeyError):
+            entry = None
+    if entry is None or entry["url"] != url:
+        return None, dict()
+    headers = dict()
+    if entry["etag"] is not None:
+        headers["If-None-Match"] = entry["etag"]
+    if entry["last_modified"] is not None:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return entry, headers
+
+
+def __save_validators__(url, resp_headers, result):
+    """
+    Save the validators of the response to url with the parsed result,
+    a list of tuples.
+    """
+
+    etag = resp_headers.get("ETag", None)
+    last_modified = resp_headers.get("Last-Modified", None)
+    if etag is None and last_modified is None:
+        return
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    entry = {"url": url, "etag": etag, "last_modified": last_modified, "result": result}
+    with __meta_lock__:
+        __validators__[key] = entry
+        __validators__.move_to_end(key)
+        while len(__validators__) > __ca__["metadata_size"]:
+            __validators__.popitem(last=False)
+    if __ca__["metadata_dir"] is not None:
+        makedirs(path.join(__ca__["metadata_dir"], "__http__"), exist_ok=True)
+        fname = path.join(__ca__["metadata_dir"], "__http__", key + ".json")
+        with open(fname + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        replace(fname + ".tmp", fname)
+
+
+def __get_async_key__(root):
+    """
+    Return the status and the key of a queued request.
+    """
+
+    try:
+        status = root.find(__Uri__.async_status_path).text
+    except:
+        try:
+            status = root.find(__Uri__.sync_status_path).text
+        except:
+            print('Unexpected error: Status path not found.')
+            raise ConnectionError
+    try:
+        key = root.find(__Uri__.async_key_path).text
+    except:
+        try:
+            key = root.find(__Uri__.sync_key_path).text
+        except:
+            print('Unexpected error: Key path not found.')
+            raise ConnectionError
+    return status, key
+
+
+def __submit_job__(provider, key):
+    """
+    Add the queued request with given key to the jobs
+    polled by the scheduler thread.
+    Return a Future, set to the URL of the data when they are AVAILABLE,
+    or to a TimeoutError after poll_timeout.
+    """
+
+    global __jobs_thread__
+    fut = Future()
+    fut.set_running_or_notify_cancel()
+    job = {"url": __Uri__.BASE_ASYNC_URL[provider] + "status/" + key,
+           "provider": provider,
+           "submitted": time.time(),
+           "deadline": time.time() + __sa__["poll_timeout"],
+           "future": fut,
+           "delay": __sa__["poll_interval"],
+           "next_poll": time.time() + min(__sa__["poll_interval"], __sa__["poll_timeout"])}
+    with __jobs_cond__:
+        __jobs__.append(job)
+        if __jobs_thread__ is None:
+            __jobs_thread__ = threading.Thread(target=__poll_jobs__, daemon=True)
+            __jobs_thread__.start()
+        __jobs_cond__.notify()
+    return fut
+
+
+def __poll_jobs__():
+    """
+    Scheduler thread: poll the status of the due jobs,
+    then wait for the next one. The interval between two polls
+    of the same job is doubled each time, up to poll_max_interval.
+    The thread ends when there are no jobs left. If it fails,
+    all the jobs fail with the same error, and the next job
+    starts a new thread.
+    """
+
+    global __jobs_thread__
+    due = []
+    try:
+        while True:
+            with __jobs_cond__:
+                if __jobs__ == []:
+                    __jobs_thread__ = None
+                    return
+                now = time.time()
+                due = [j for j in __jobs__ if j["next_poll"] <= now]
+                if due == []:
+                    __jobs_cond__.wait(min(j["next_poll"] for j in __jobs__) - now)
+                    continue
+            for job in due:
+                if time.time() >= job["deadline"]:
+                    status = TimeoutError("The queued request is not available after " +
+                                          str(__sa__["poll_timeout"]) + " sec: " + job["url"])
+                else:
+                    try:
+                        resp = __get_raw_resp__(job["url"], True)
+                        status = __check_async_status__(__get_xml_root__(resp))
+                    except Exception as e:
+                        status = e
+                with __jobs_cond__:
+                    if isinstance(status, Exception) or status == "AVAILABLE":
+                        __jobs__.remove(job)
+                    else:
+                        job["delay"] = min(job["delay"] * 2, __sa__["poll_max_interval"])
+                        job["next_poll"] = min(time.time() + job["delay"], job["deadline"])
+                if isinstance(status, Exception):
+                    job["future"].set_exception(status)
+                elif status == "AVAILABLE":
+                    job["future"].set_result(job["url"].replace("/status/", "/data/"))
+                    __emit__("queued", url=job["url"], provider=job["provider"],
+                             duration=time.time() - job["submitted"])
+    except BaseException as e:
+        with __jobs_cond__:
+            jobs = due + __jobs__
+            del __jobs__[:]
+            __jobs_thread__ = None
+        for job in jobs:
+            if not job["future"].done():
+                job["future"].set_exception(e)
+        raise
+
+
+def __check_async_status__(root):
+    status = root.find(__Uri__.async_status_path).text
+    if status in ["EXPIRED", "UNKNOWN_REQUEST"]:
+        raise ConnectionError
+    elif status not in ["SUBMITTED", "PROCESSING", "AVAILABLE"]:
+        print("Unexpected async status: " + status + " Try again.")
+        raise ConnectionError
+    return status
+
+def __get_cached_data_df__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers=1,
+                           incremental=False, compact=False):
+    """
+    Read the dataset from data_dir if it is there and up to date,
+    otherwise download it and save it in data_dir.
+    If incremental, only the periods from the last one in data_dir
+    are downloaded, unless the structure of the dataset has changed.
+    """
+
+    key, entry = __get_data_entry__(code, flags, filter_pars, compact)
+    df = __read_cached_data_df__(key, entry, dsd_last_update)
+    if df is not None:
+        return df
+    old_df, update_pars = __get_update_pars__(code, entry, filter_pars) if incremental else (None, None)
+    df = None
+    if update_pars is not None:
+        df = __merge_periods_df__(old_df,
+                                  __get_data_df__(code, dims, flags, update_pars, verbose, provider, dsd_last_update,
+                                                  max_workers, compact))
+    if df is None:
+        df = __get_data_df__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers,
+                             compact)
+    if df is not None:
+        __save_data_entry__(key, code, flags, filter_pars, dsd_last_update, df)
+    return df
+
+
+def __get_update_pars__(code, entry, filter_pars):
+    """
+    Return the dataset of the outdated cache entry and the filter_pars
+    to download its periods from the last one on,
+    or (None, None) if it must be fully downloaded again.
+    The last period is downloaded again, because it is the most often revised.
+    """
+
+    meta = __load_meta__(code.upper())
+    if entry is None or meta is None or entry["update_structure"] != meta["update_structure"]:
+        return None, None
+    df = __read_data_file__(entry)
+    if df is None:
+        return None, None
+    periods = __get_periods__(df)
+    # periods of different frequencies can not be compared: their formats
+    # differ by the letter after the year (2020-01, 2020-Q1, 2020-S1, 2020-W05)
+    if periods == [] or len(set(re.sub(r"\d", "9", p) for p in periods)) != 1:
+        return None, None
+    return df, dict(filter_pars, startPeriod=max(periods))
+
+
+def __get_periods__(df):
+    """
+    Return the list of the periods in the columns of a dataset.
+    """
+
+    n_text_fields = [i for i, c in enumerate(df.columns) if "\\" in c][0] + 1
+    periods = []
+    for c in df.columns[n_text_fields:]:
+        p = c[:-len("_value")] if c.endswith("_value") else c[:-len("_flag")] if c.endswith("_flag") else c
+        if p not in periods:
+            periods.append(p)
+    return periods
+
+
+def __merge_periods_df__(old_df, new_df):
+    """
+    Replace in old_df the periods of new_df, and add the new ones.
+    The time series are matched on the text fields.
+    Return None if new_df has new time series, whose past periods are missing.
+    """
+
+    if new_df is None:
+        return old_df
+    n_text_fields = [i for i, c in enumerate(old_df.columns) if "\\" in c][0] + 1
+    text_cols = list(old_df.columns[:n_text_fields])
+    old_i = old_df.set_index(text_cols)
+    new_i = new_df.set_index(text_cols)
+    if not new_i.index.isin(old_i.index).all():
+        return None
+    old_i = old_i.drop(columns=[c for c in new_i.columns if c in old_i.columns])
+    # the series keep the order of old_df, as in a full download
+    return old_i.join(new_i, how="left").reset_index()
+
+
+def __read_cached_data_df__(key, entry, dsd_last_update):
+    """
+    Return the dataset of the cache entry if it is up to date, otherwise None.
+    """
+
+    df = None
+    if entry is not None and entry["update_data"] == dsd_last_update:
+        df = __read_data_file__(entry)
+    __emit__("cache", kind="data", key=key, hit=df is not None)
+    if df is not None:
+        with __data_lock__:
+            index = __load_data_index__()
+            if key in index:
+                index[key]["last_access"] = time.time()
+                __save_data_index__(index)
+    return df
+
+
+def __df_to_tuples__(df):
+    if df is None:
+        return []
+    return [tuple(df.columns), ] +\
+        list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def __get_data_entry__(code, flags, filter_pars, compact=False):
+    """
+    Return the key of the dataset in the cache and its entry, or None.
+    """
+
+    pars = dict((str(k), sorted([str(v) for v in filter_pars[k]]) if type(filter_pars[k]) is list
+                 else str(filter_pars[k])) for k in filter_pars)
+    key_str = json.dumps([code.upper(), flags, pars] + (["compact"] if compact else []), sort_keys=True)
+    key = code.upper() + "_" + hashlib.sha1(key_str.encode("utf-8")).hexdigest()[:16]
+    with __data_lock__:
+        entry = __load_data_index__().get(key, None)
+    return key, entry
+
+
+def __read_data_file__(entry):
+    fname = path.join(__ca__["data_dir"], entry["file"])
+    try:
+        if entry["format"] == "parquet":
+            df = read_parquet(fname)
+        elif entry["format"] == "feather":
+            df = read_feather(fname)
+        else:
+            return read_pickle(fname)
+    except (OSError, ValueError, ImportError):
+        return None
+    # the text columns are read back as strings, but are downloaded as objects
+    for c in df.columns:
+        if isinstance(df[c].dtype, StringDtype):
+            df[c] = df[c].astype(object)
+    return df
+
+
+def __save_data_entry__(key, code, flags, filter_pars, update_data, df):
+    frmt = __ca__["data_format"]
+    fname = key + "." + frmt
+    fpath = path.join(__ca__["data_dir"], fname)
+    meta = __load_meta__(code.upper())
+    makedirs(__ca__["data_dir"], exist_ok=True)
+    tmp = __get_tmp_name__(fpath)
+    if frmt == "parquet":
+        df.to_parquet(tmp, index=False)
+    elif frmt == "feather":
+        df.reset_index(drop=True).to_feather(tmp)
+    else:
+        df.to_pickle(tmp)
+    replace(tmp, fpath)
+    with __data_lock__:
+        index = __load_data_index__()
+        if key in index and index[key]["file"] != fname:
+            __remove_data_entry__(index, key)
+        index[key] = {"code": code.upper(),
+                      "flags": flags,
+                      "filter_pars": dict((str(k), filter_pars[k]) for k in filter_pars),
+                      "update_data": update_data,
+                      "update_structure": None if meta is None else meta["update_structure"],
+                      "file": fname,
+                      "format": frmt,
+                      "size": path.getsize(fpath),
+                      "last_access": time.time()}
+        # remove the least recently used datasets, but the last one
+        size = sum(e["size"] for e in index.values())
+        for k in sorted(index, key=lambda k: index[k]["last_access"]):
+            if size <= __ca__["data_max_size"]:
+                break
+            if k == key:
+                continue
+            size -= index[k]["size"]
+            __remove_data_entry__(index, k)
+        __save_data_index__(index)
+
+
+def __remove_data_entry__(index, key):
+    entry = index.pop(key)
+    try:
+        remove(path.join(__ca__["data_dir"], entry["file"]))
+    except OSError:
+        pass
+
+
+def __load_data_index__():
+    try:
+        with open(path.join(__ca__["data_dir"], "index.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def __save_data_index__(index):
+    makedirs(__ca__["data_dir"], exist_ok=True)
+    fname = path.join(__ca__["data_dir"], "index.json")
+    tmp = __get_tmp_name__(fname)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, default=str)
+    replace(tmp, fname)
+
+
+def __get_tmp_name__(fname):
+    """
+    Return a temporary file name for fname, own to this process and thread,
+    so that processes sharing a cache folder do not write the same file.
+    """
+
+    return fname + "." + str(getpid()) + "_" + str(threading.get_ident()) + ".tmp"
+
+
+def __get_data__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers=1):
+    urls = __get_data_urls__(code, dims, filter_pars, provider)
+    chunks = __get_chunks__(urls,
+                            lambda url: __get_data_chunk__(url, flags, provider),
+                            verbose,
+                            max_workers)
+    return __join_chunks__(chunks)
+
+
+def __join_chunks__(chunks):
+    alldata = []
+    for head, data in chunks:
+        if head is not None and alldata == []:
+            alldata = [head, ]
+        alldata.extend(data)
+
+    return alldata
+
+
+def __get_data_df__(code, dims, flags, filter_pars, verbose, provider, dsd_last_update, max_workers=1,
+                    compact=False, long=False, reverse_time=False):
+    urls = __get_data_urls__(code, dims, filter_pars, provider)
+    if long:
+        # each part is turned to the long layout as soon as it is parsed
+        get_chunk = lambda url: __long_df__(__get_data_chunk_df__(url, flags, provider, compact), flags, reverse_time)
+    else:
+        get_chunk = lambda url: __get_data_chunk_df__(url, flags, provider, compact)
+    chunks = __get_chunks__(urls,
+                            get_chunk,
+                            verbose,
+                            max_workers)
+    return __concat_chunks_df__(chunks)
+
+
+def __long_df__(df, flags, reverse_time=False):
+    """
+    Turn a dataframe with a column per period into a dataframe
+    with a row per observation: the dimensions, time (the start
+    of the period), value and flag (if flags).
+    The columns are repeated and raveled as arrays, without melting.
+    """
+
+    if df is None:
+        return None
+    n_text_fields = [i for i, c in enumerate(df.columns) if "\\" in c][0] + 1
+    if flags:
+        val_cols = list(df.columns[n_text_fields::2])
+        flag_cols = list(df.columns[n_text_fields + 1::2])
+        periods = [c[:-len("_value")] for c in val_cols]
+    else:
+        val_cols = list(df.columns[n_text_fields:])
+        flag_cols = []
+        periods = list(val_cols)
+    if reverse_time:
+        val_cols.reverse()
+        flag_cols.reverse()
+        periods.reverse()
+    n_rows = len(df)
+    n_periods = len(periods)
+    cols = dict()
+    for c in df.columns[:n_text_fields]:
+        cols[c.split("\\")[0]] = df[c].repeat(n_periods).array
+    cols["time"] = __parse_periods__(periods).take(np.tile(np.arange(n_periods), n_rows))
+    compact = n_periods > 0 and all(df[c].dtype == "float32" for c in val_cols)
+    cols["value"] = df[val_cols].to_numpy(dtype="float32" if compact else float).ravel()
+    if flags:
+        fl = df[flag_cols].to_numpy(dtype=object).ravel()
+        cols["flag"] = Categorical(fl) if compact else fl
+    return DataFrame(cols)
+
+
+def __parse_periods__(periods):
+    """
+    Parse the Eurostat time periods (2020, 2020-Q1, 2020-S1, 2020-01,
+    2020-W01, 2020-01-15) as the dates of their start.
+    Return a DatetimeIndex (NaT for the unknown formats).
+    """
+
+    dates = []
+    for p in periods:
+        m = re.match(r"^(\d{4})(?:-(Q|S|W)?(\d{1,2})(?:-(\d{2}))?)?$", p.strip())
+        if m is None:
+            dates.append(None)
+            continue
+        year, kind, num, day = m.groups()
+        year = int(year)
+        try:
+            if num is None:
+                dates.append(datetime(year, 1, 1))
+            elif kind == "Q":
+                dates.append(datetime(year, 3 * int(num) - 2, 1))
+            elif kind == "S":
+                dates.append(datetime(year, 6 * int(num) - 5, 1))
+            elif kind == "W":
+                dates.append(datetime.fromisocalendar(year, int(num), 1))
+            else:
+                dates.append(datetime(year, int(num), 1 if day is None else int(day)))
+        except ValueError:
+            dates.append(None)
+    return to_datetime(Series(dates, dtype=object)).array
+
+
+def __concat_chunks_df__(chunks):
+    chunks = [c for c in chunks if c is not None]
+    if chunks == []:
+        return None
+    elif len(chunks) == 1:
+        return chunks[0]
+    else:
+        # the categories of the parts are joined, so that the columns stay categorical
+        for col in chunks[0].columns:
+            if all(col in c.columns and isinstance(c[col].dtype, CategoricalDtype) for c in chunks):
+                categories = union_categoricals([c[col] for c in chunks]).categories
+                for c in chunks:
+                    c[col] = c[col].cat.set_categories(categories)
+        return concat(chunks, ignore_index=True)
+
+
+def __get_data_urls__(code, dims, filter_pars, provider):
     if filter_pars == dict():
-        filt = "?"
+        filt = ["?", ]
     else:
         start = ""
         end = ""
@@ -591,83 +2622,461 @@ def __get_data__(code, dims, flags, filter_pars, verbose, provider, dsd_last_upd
                     filter_pars[k]) is list else [filter_pars[k], ]
 
         if len(nontime_pars) > 0:
-            filter_lists = [tuple(zip(
-                (d,) * len(nontime_pars[str(d)]), nontime_pars[str(d)])) for d in nontime_pars]
-            cart = [el for el in product(*filter_lists)]
-            filter_str_list = [
-                ".".join([dict(c).get(j[1], "") for j in sorted(dims)]) for c in cart]
+            base_len = len(__Uri__.BASE_URL[provider] + "data/" + code + "/?" +
+                           start + end + "format=TSV&compressed=true")
             filt = []
-            for f in filter_str_list:
+            for f in __get_keys__(dims, nontime_pars, __sa__["max_url_length"] - base_len):
                 filt.append("/" + f + "?" + start + end)
         else:
             filt = ["?" + start + end, ]
 
-    alldata = []
-    is_header = False
+    return [__Uri__.BASE_URL[provider] +
+            "data/" +
+            code +
+            f_str +
+            "format=TSV&compressed=true" for f_str in filt]
+
+
+def __get_keys__(dims, nontime_pars, max_key_length):
+    """
+    Build the SDMX keys ("A.B+C..D") selecting the values in nontime_pars.
+    The values of a dimension are joined with "+", so that a single
+    request is done, unless the key is longer than max_key_length or
+    selects more than max_combinations series: then the longest list of
+    values is split in two, until the keys are small enough.
+    Return a list of keys.
+    """
+
+    def pos(d):
+        try:
+            return int(d[0])
+        except (TypeError, ValueError):
+            return d[0]
+
+    dims_ids = [d[1] for d in sorted(dims, key=pos)]
+    values = [[str(v) for v in nontime_pars.get(d, [])] for d in dims_ids]
+    return __split_keys__(values, max_key_length)
+
+
+def __split_keys__(values, max_key_length):
+    key = ".".join(["+".join(v) for v in values])
+    n_comb = 1
+    for v in values:
+        n_comb *= max(len(v), 1)
+    longest = max(range(len(values)), key=lambda i: len(values[i]))
+    if (len(key) <= max_key_length and n_comb <= __sa__["max_combinations"]) or\
+       len(values[longest]) <= 1:
+        return [key, ]
+    half = len(values[longest]) // 2
+    first = values[:longest] + [values[longest][:half], ] + values[longest + 1:]
+    second = values[:longest] + [values[longest][half:], ] + values[longest + 1:]
+    return __split_keys__(first, max_key_length) + __split_keys__(second, max_key_length)
+
+
+def __get_chunks__(items, func, verbose, max_workers):
+    """
+    Apply func to all items using up to max_workers threads.
+    Return the results in the same order as items.
+    """
+
+    results = [None] * len(items)
+    n_items = len(items)
+    if verbose:
+        counter = 0
+        print("\rDownload progress: {:3.1%}".format(counter), end="\r")
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = dict((executor.submit(func, item), i) for i, item in enumerate(items))
+    try:
+        for fut in as_completed(futures):
+            results[futures[fut]] = fut.result()
+            if verbose:
+                counter += 1
+                print("\rDownload progress: {:3.1%}".format(
+                    counter/n_items), end="\r")
+    finally:
+        for fut in futures:
+            fut.cancel()
+        executor.shutdown(wait=True)
+    return results
+
+
+def __get_data_chunk__(data_url, flags, provider):
+    """
+    Download and parse one part of a dataset.
+    Return (header, list of rows), header is None if there is no data.
+    """
+
+    resp = __get_resp__(data_url, provider=provider)
+    if resp is None:
+        return None, []
+    return __parse_tsv__(resp.content, flags)
+
+
+def __parse_tsv__(content, flags):
+    """
+    Parse the gzipped TSV content.
+    Return (header, list of rows).
+    """
+
+    data = []
     if flags:
         n_el = 2
     else:
         n_el = 1
-    filt_len = len(filt)
-    if verbose:
-        counter = 0
-        print("\rDownload progress: {:3.1%}".format(counter), end="\r")
-    for f_str in filt:
-        data_url = __Uri__.BASE_URL[provider] +\
-                    "data/" +\
-                    code +\
-                    f_str +\
-                    "format=TSV&compressed=true"
-        resp = __get_resp__(data_url, provider=provider)
-        data = []
-        if resp is not None:
+    start = time.time()
+    try:
+        dec = decompress(content).decode("utf-8")
+    except:
+        print(content)
+    decompress_time = time.time() - start
+    raw_data = dec.split("\r\n")
+    head, n_text_fields = __parse_head__(raw_data[0], flags)
+    for row in raw_data[1:]:
+        if row != '':
+            data.append(__parse_row__(row, n_text_fields, n_el))
+    __emit__("parse", decompress_time=decompress_time, parse_time=time.time() - start - decompress_time,
+             rows=len(data), cells=len(data) * len(head), duration=time.time() - start)
+
+    return head, data
+
+
+def __iter_data_chunk__(data_url, flags, provider, chunk_size):
+    """
+    Download one part of a dataset as a stream,
+    decompressing and parsing it while it arrives.
+    Return a generator of tuples: the first one is the header.
+    """
+
+    if flags:
+        n_el = 2
+    else:
+        n_el = 1
+    resp = __get_resp__(data_url, provider=provider, stream=True, chunk_size=chunk_size)
+    if resp is None:
+        return
+    try:
+        unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        tail = ""
+        n_text_fields = None
+        n_rows = 0
+        decompress_time = 0.
+        start = time.time()
+        chunks = resp.chunks if hasattr(resp, "chunks") else [resp.content, ]
+        for chunk in chunks:
+            while chunk:
+                t = time.time()
+                text = decoder.decode(unzip.decompress(chunk))
+                decompress_time += time.time() - t
+                # a new gzip member may follow the end of the previous one
+                chunk = unzip.unused_data
+                if unzip.eof:
+                    unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                raw_data = (tail + text).split("\r\n")
+                tail = raw_data.pop()
+                for row in raw_data:
+                    if n_text_fields is None:
+                        head, n_text_fields = __parse_head__(row, flags)
+                        yield head
+                    elif row != '':
+                        n_rows += 1
+                        yield __parse_row__(row, n_text_fields, n_el)
+        tail += decoder.decode(unzip.flush(), final=True)
+        if tail != '' and n_text_fields is not None:
+            n_rows += 1
+            yield __parse_row__(tail, n_text_fields, n_el)
+        # the time spent by the caller between two rows is included
+        __emit__("parse", decompress_time=decompress_time, parse_time=time.time() - start - decompress_time,
+                 rows=n_rows, cells=n_rows * (len(head) if n_text_fields is not None else 0),
+                 duration=time.time() - start)
+    finally:
+        resp.close()
+
+
+def __iter_data_batches__(data_url, provider, batch_size, parse):
+    """
+    Download one part of a dataset as a stream, and parse it with
+    parse(TSV bytes) every batch_size bytes of decompressed data.
+    Each batch starts with the header of the TSV.
+    Return a generator of the parsed batches.
+    """
+
+    resp = __get_resp__(data_url, provider=provider, stream=True)
+    if resp is None:
+        return
+    try:
+        unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        head = None
+        block = bytearray()
+        chunks = resp.chunks if hasattr(resp, "chunks") else [resp.content, ]
+        for chunk in chunks:
+            while chunk:
+                block += unzip.decompress(chunk)
+                # a new gzip member may follow the end of the previous one
+                chunk = unzip.unused_data
+                if unzip.eof:
+                    unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                if head is None and b"\n" in block:
+                    i = block.find(b"\n") + 1
+                    head = bytes(block[:i])
+                    del block[:i]
+                if head is not None and len(block) >= batch_size:
+                    i = block.rfind(b"\n") + 1
+                    if i > 0:
+                        yield parse(head + bytes(block[:i]))
+                        del block[:i]
+        block += unzip.flush()
+        if head is not None and block.strip():
+            yield parse(head + bytes(block))
+    finally:
+        resp.close()
+
+
+def __parse_head__(row, flags):
+    """
+    Return the header tuple and the number of text fields.
+    """
+
+    n_text_fields = len(row[:row.find("\t")].split(","))
+    row_list = re.split(r"\t|,", row)
+    if flags:
+        head = row_list[:n_text_fields] +\
+                  [x.strip()+f for x in row_list[n_text_fields:]
+                       for f in ("_value", "_flag")]
+    else:
+        head = [x.strip() for x in row_list]
+    return tuple(head), n_text_fields
+
+
+def __parse_row__(row, n_text_fields, n_el):
+    row_list = re.split(r"\t|,", row)
+    l = row_list[:n_text_fields]
+    for el in row_list[n_text_fields:]:
+        tmp = [t.strip() for t in el.split(" ")]
+        if tmp[0] == None:
+            tmp = [None, None]
+        elif tmp[0] == ":" or tmp[0] == "0n" or tmp[0] == "n":
+            if len(tmp) == 1:
+                tmp.insert(0, None)
+            elif len(tmp) == 2:
+                tmp[1] = " ".join(tmp).strip()
+                tmp[0] = None
+            else:
+                raise Exception
+        else:
             try:
-                dec = decompress(resp.content).decode("utf-8")
+                tmp[0] = float(tmp[0])
             except:
-                print(resp.content)
-            n_text_fields = len(dec[:dec.find("\t")].split(","))
-            raw_data = dec.split("\r\n")
-            is_first_data_row = True
-            for row in raw_data:
-                row_list = re.split(r"\t|,", row)
-                if is_first_data_row:
-                    is_first_data_row = False
-                    if not is_header:
-                        is_header = True
-                        if flags:
-                            head = row_list[:n_text_fields] +\
-                                      [x.strip()+f for x in row_list[n_text_fields:]
-                                           for f in ("_value", "_flag")]
-                        else:
-                            head = [x.strip() for x in row_list]
-                        alldata = [tuple(head),]
-                elif row_list != ['',]:
-                    l = row_list[:n_text_fields]
-                    for el in row_list[n_text_fields:]:
-                        tmp = [t.strip() for t in el.split(" ")]
-                        if tmp[0] == None:
-                            tmp = [None, None]
-                        elif tmp[0] == ":" or tmp[0] == "0n" or tmp[0] == "n":
-                            if len(tmp) == 1:
-                                tmp.insert(0, None)
-                            elif len(tmp) == 2:
-                                tmp[1] = " ".join(tmp).strip()
-                                tmp[0] = None
-                            else:
-                                raise Exception
-                        else:
-                            try:
-                                tmp[0] = float(tmp[0])
-                            except:
-                                tmp = [el, None]
-                        l.extend(tmp[:n_el])
-                    data.append(tuple(l))
+                tmp = [el, None]
+        l.extend(tmp[:n_el])
+    return tuple(l)
 
-        alldata.extend(data)
 
-        if verbose:
-            counter += 1
-            print("\rDownload progress: {:3.1%}".format(
-                counter/filt_len), end="\r")
+def __get_data_chunk_df__(data_url, flags, provider, compact=False):
+    """
+    Download one part of a dataset and parse it by columns.
+    Return a dataframe, or None if there is no data.
+    """
 
-    return alldata
+    resp = __get_resp__(data_url, provider=provider)
+    if resp is None:
+        return None
+    return __parse_tsv_content_df__(resp.content, flags, compact)
+
+
+def __parse_tsv_content_df__(content, flags, compact=False):
+    """
+    Decompress and parse the gzipped TSV content.
+    Return a dataframe.
+    """
+
+    start = time.time()
+    dec = decompress(content)
+    decompress_time = time.time() - start
+    df = __parse_tsv_df__(dec, flags, compact)
+    __emit__("parse", decompress_time=decompress_time, parse_time=time.time() - start - decompress_time,
+             rows=len(df), cells=df.size, duration=time.time() - start)
+    return df
+
+
+def __get_data_chunk_arrow__(data_url, flags, provider):
+    """
+    Download one part of a dataset and parse it with pyarrow.
+    Return a pyarrow Table, or None if there is no data.
+    """
+
+    resp = __get_resp__(data_url, provider=provider)
+    if resp is None:
+        return None
+    start = time.time()
+    dec = decompress(resp.content)
+    decompress_time = time.time() - start
+    table = __parse_tsv_arrow__(dec, flags)
+    __emit__("parse", decompress_time=decompress_time, parse_time=time.time() - start - decompress_time,
+             rows=table.num_rows, cells=table.num_rows * table.num_columns, duration=time.time() - start)
+    return table
+
+
+def __iter_data_arrow__(urls, flags, provider, batch_size):
+    for url in urls:
+        parse = lambda dec: __parse_tsv_arrow__(dec, flags)
+        for table in __iter_data_batches__(url, provider, batch_size, parse):
+            for batch in table.to_batches():
+                yield batch
+
+
+def __parse_tsv_arrow__(dec, flags):
+    """
+    Parse the TSV dec (bytes) with the CSV reader of pyarrow.
+    When commas and spaces are only used as separators, they are turned
+    into tabs and the values are read as floats directly. Otherwise, each
+    cell "value flag" is split by a regular expression. The marks of the
+    missing values (e.g. ":") are moved to the flags, as in __parse_tsv_df__.
+    The text fields and the flags are dictionary-encoded.
+    Return a pyarrow Table.
+    """
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pcsv
+
+    head = dec[:dec.find(b"\n")].decode("utf-8").rstrip("\r").split("\t")
+    text_names = head[0].split(",")
+    periods = [c.strip() for c in head[1:]]
+    n_lines = dec.count(b"\n")
+    if dec.count(b" ") == len(periods) * n_lines and\
+       dec.count(b",") == (len(text_names) - 1) * n_lines:
+        val_names = [p + "_value" for p in periods]
+        flag_names = [p + "_flag" for p in periods]
+        names = text_names + [c for pair in zip(val_names, flag_names) for c in pair]
+        types = dict([(c, pa.dictionary(pa.int32(), pa.string())) for c in text_names + flag_names] +
+                     [(c, pa.float64()) for c in val_names])
+        try:
+            table = pcsv.read_csv(BytesIO(dec.replace(b",", b"\t").replace(b" ", b"\t")),
+                                  read_options=pcsv.ReadOptions(skip_rows=1, column_names=names),
+                                  parse_options=pcsv.ParseOptions(delimiter="\t", quote_char=False),
+                                  convert_options=pcsv.ConvertOptions(
+                                      column_types=types, null_values=[":"], strings_can_be_null=False,
+                                      include_columns=(names if flags else text_names + val_names)))
+        except pa.ArrowInvalid:
+            # other marks than ":" are in the values
+            table = None
+        if table is not None and flags:
+            for v, f in zip(val_names, flag_names):
+                is_mark = pc.is_null(table.column(v))
+                if pc.any(is_mark).as_py():
+                    fl = pc.cast(table.column(f), pa.string())
+                    fl = pc.if_else(is_mark, pc.utf8_trim_whitespace(pc.binary_join_element_wise(":", fl, " ")), fl)
+                    table = table.set_column(table.schema.get_field_index(f), f, pc.dictionary_encode(fl))
+        if table is not None:
+            return table if flags else table.rename_columns(text_names + periods)
+
+    raw_names = ["c%d" % i for i in range(len(head))]
+    raw = pcsv.read_csv(BytesIO(dec),
+                        read_options=pcsv.ReadOptions(skip_rows=1, column_names=raw_names),
+                        parse_options=pcsv.ParseOptions(delimiter="\t", quote_char=False),
+                        convert_options=pcsv.ConvertOptions(
+                            column_types=dict((c, pa.string()) for c in raw_names),
+                            strings_can_be_null=False))
+    names = list(text_names)
+    cols = []
+    text = pc.split_pattern(raw.column(0), ",", max_splits=len(text_names) - 1)
+    for i in range(len(text_names)):
+        cols.append(pc.dictionary_encode(pc.list_element(text, i)) if raw.num_rows else
+                    pa.chunked_array([], pa.dictionary(pa.int32(), pa.string())))
+    for p, c in zip(periods, raw_names[1:]):
+        cell = pc.extract_regex(raw.column(c), r"^\s*(?P<v>\S*)\s*(?P<f>.*?)\s*$")
+        v = pc.struct_field(cell, "v")
+        is_num = pc.match_substring_regex(v, r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+        names.append(p + "_value" if flags else p)
+        cols.append(pc.cast(pc.if_else(is_num, v, pa.scalar(None, pa.string())), pa.float64()))
+        if flags:
+            is_mark = pc.and_(pc.invert(is_num), pc.not_equal(v, ""))
+            f = pc.struct_field(cell, "f")
+            f = pc.if_else(is_mark, pc.utf8_trim_whitespace(pc.binary_join_element_wise(v, f, " ")), f)
+            names.append(p + "_flag")
+            cols.append(pc.dictionary_encode(f))
+    return pa.table(cols, names=names)
+
+
+def __parse_tsv_df__(dec, flags, compact=False):
+    """
+    Parse the TSV dec (bytes) with the C parser of pandas.
+    Each row is "dim1,dim2,...\tvalue flag\tvalue flag...": when commas and
+    spaces are only used as separators, they are turned into tabs and
+    values are read as floats directly. Otherwise, the cells are split
+    column by column.
+    If compact, the text fields and the flags are categorical
+    and the values are float32.
+    """
+
+    head = dec[:dec.find(b"\n")].decode("utf-8").rstrip("\r").split("\t")
+    text_names = head[0].split(",")
+    periods = [c.strip() for c in head[1:]]
+    n_lines = dec.count(b"\n")
+    if dec.count(b" ") != len(periods) * n_lines:
+        # add the space to the cells without flag separator, e.g. ":"
+        dec = re.sub(rb"(?<=\t)([^\t\r\n ]*)(?=[\t\r\n])", rb"\1 ", dec)
+    if dec.count(b" ") == len(periods) * n_lines and\
+       dec.count(b",") == (len(text_names) - 1) * n_lines:
+        val_names = [p + "_value" for p in periods]
+        flag_names = [p + "_flag" for p in periods]
+        names = text_names + [c for pair in zip(val_names, flag_names) for c in pair]
+        df = read_csv(BytesIO(dec.replace(b",", b"\t").replace(b" ", b"\t")),
+                      sep="\t", header=None, skiprows=1, names=names,
+                      dtype=dict([(c, "category" if compact else object) for c in text_names] +
+                                 [(c, object) for c in flag_names]),
+                      na_values=dict((c, [":"]) for c in val_names),
+                      keep_default_na=False,
+                      usecols=(names if flags else text_names + val_names))
+        for v, f in zip(val_names, flag_names):
+            if df[v].dtype.kind in "iub":
+                df[v] = df[v].astype(float)
+            if df[v].dtype != float:
+                marks = df[v].to_numpy(dtype=object)
+                df[v] = to_numeric(df[v], errors="coerce")
+                is_mark = df[v].isna().to_numpy() & (marks != "")
+                marks = [m if type(m) is str else ":" for m in marks[is_mark]]
+            else:
+                is_mark = df[v].isna().to_numpy()
+                marks = [":"] * is_mark.sum()
+            if flags and is_mark.any():
+                fl = df[f].to_numpy(dtype=object, copy=True)
+                fl[is_mark] = [(m + " " + x).strip() for m, x in zip(marks, fl[is_mark])]
+                df[f] = Series(fl, index=df.index, dtype=object)
+            if compact:
+                df[v] = df[v].astype("float32")
+                if flags:
+                    df[f] = df[f].astype("category")
+        if not flags:
+            df.columns = text_names + periods
+        return df
+
+    raw = read_csv(BytesIO(dec), sep="\t", dtype=object,
+                   keep_default_na=False, na_filter=False)
+    n_rows = len(raw)
+    if n_rows == 0:
+        if flags:
+            return DataFrame(columns=text_names + [p + f for p in periods for f in ("_value", "_flag")])
+        else:
+            return DataFrame(columns=text_names + periods)
+    df = raw.iloc[:, 0].str.split(",", n=len(text_names) - 1, expand=True)
+    df.columns = text_names
+    if compact:
+        df = df.astype("category")
+    cells = Series(raw.iloc[:, 1:].to_numpy().ravel())
+    parts = cells.str.partition(" ")
+    values = to_numeric(parts[0], errors="coerce").to_numpy(dtype="float32" if compact else float)
+    values = values.reshape(n_rows, len(periods))
+    cols = dict()
+    if flags:
+        is_mark = parts[0].isin([":", "0n", "n"])
+        fl = parts[2].str.partition(" ")[0].str.strip()
+        fl = fl.where(~is_mark, cells.str.strip()).to_numpy().reshape(n_rows, len(periods))
+        for i, p in enumerate(periods):
+            cols[p + "_value"] = values[:, i]
+            cols[p + "_flag"] = Categorical(fl[:, i]) if compact else fl[:, i]
+    else:
+        for i, p in enumerate(periods):
+            cols[p] = values[:, i]
+    return concat([df, DataFrame(cols, index=df.index)], axis=1)
@@ -45,4 +45,10 @@ setup(name='eurostat',
           'pandas',
           'requests',
           ],
+      # pandas, in install_requires, is still needed by the arrow and polars functions
+      extras_require={
+          'async': ['aiohttp'],
+          'arrow': ['pyarrow>=14'],
+          'polars': ['polars', 'pyarrow>=14'],
+          },
       )
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Noemi E. Cazzaniga - 2024
+@email: noemi.cazzaniga@polimi.it
+"""
+
+
+## Offline benchmark of the package, against the local stand-in
+## of the Eurostat API in sdmx_server.py: no network is needed.
+##
+## python test/benchmark.py [--sizes small,medium] [--repeat 3]
+##                          [--output report.json] [--compare old_report.json]
+##
+## The report is printed and, with --output, saved as JSON.
+## With --compare, each result is compared with the same one in an old report.
+
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import eurostat
+import sdmx_server
+
+
+SIZES = {"small": (100, 10),
+         "medium": (10000, 20),
+         "large": (100000, 20)}
+
+
+def best_time(func, repeat):
+    """
+    Return the best time of repeat calls of func, in seconds.
+    """
+
+    times = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def peak_memory(func):
+    """
+    Return the peak of the memory allocated by func, in MB.
+    """
+
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def n_obs(code):
+    __, dims, periods = sdmx_server.DATASETS[code]
+    n = len(periods)
+    for values in dims.values():
+        n *= len(values)
+    return n
+
+
+def bench_metadata(codes, repeat):
+    results = dict()
+    for size, code in codes.items():
+        def cold():
+            eurostat.clear_cache(code)
+            eurostat.get_pars(code)
+        results["metadata.cold_ms." + size] = 1000 * best_time(cold, repeat)
+        eurostat.set_cache_args(metadata_max_age=3600.)
+        results["metadata.warm_ms." + size] = 1000 * best_time(lambda: eurostat.get_pars(code), repeat)
+        eurostat.set_cache_args(metadata_max_age=0.)
+    # provider found by probing all of them
+    code = sdmx_server.make_dataset("BENCH_GROW", 10, 5, provider="GROW")
+    def probe():
+        eurostat.clear_cache()
+        eurostat.get_pars(code)
+    results["metadata.probe_providers_ms"] = 1000 * best_time(probe, repeat)
+    return results
+
+
+def bench_toc(repeat):
+    # datasets whose titles are searched
+    for i in range(1000):
+        sdmx_server.make_dataset("BENCH_TOC_%d" % i, 1, 1, provider=("EUROSTAT", "COMEXT")[i % 2])
+    def build():
+        eurostat.set_cache_args(toc_max_age=0.)
+        eurostat.search_toc("bench")
+    results = {"toc.build_ms": 1000 * best_time(build, repeat)}
+    eurostat.set_cache_args(toc_max_age=3600.)
+    results["toc.search_ms"] = 1000 * best_time(lambda: eurostat.search_toc(["title", "bench_toc_99"]), repeat)
+    return results
+
+
+def bench_parse(codes, repeat):
+    results = dict()
+    for size, code in codes.items():
+        eurostat.get_data(code)
+        for func in [eurostat.get_data, eurostat.get_data_df]:
+            name = func.__name__ + "." + size
+            t = best_time(lambda: func(code), repeat)
+            results["parse." + name + ".obs_per_s"] = n_obs(code) / t
+            results["parse." + name + ".peak_mb"] = peak_memory(lambda: func(code))
+    return results
+
+
+def bench_chunks(code, repeat):
+    results = dict()
+    __, dims, __ = sdmx_server.DATASETS[code]
+    n_series = len(dims["unit"]) * len(dims["geo"])
+    filter_pars = {"unit": dims["unit"], "geo": dims["geo"]}
+    eurostat.set_requests_args(max_combinations=n_series // 8 + 1)
+    sdmx_server.SETTINGS["data_latency"] = 0.05
+    try:
+        eurostat.get_data_df(code, filter_pars=filter_pars)
+        for max_workers in [1, 2, 4, 8]:
+            results["chunks.8_parts.workers_%d_s" % max_workers] = best_time(
+                lambda: eurostat.get_data_df(code, filter_pars=filter_pars, max_workers=max_workers), repeat)
+    finally:
+        eurostat.set_requests_args(max_combinations=5000)
+        sdmx_server.SETTINGS["data_latency"] = 0.
+    return results
+
+
+def bench_queued(code, repeat):
+    sdmx_server.SETTINGS["queued"].add(code)
+    eurostat.set_requests_args(poll_interval=0.05)
+    try:
+        t = best_time(lambda: eurostat.get_data_df(code), repeat)
+    finally:
+        sdmx_server.SETTINGS["queued"].discard(code)
+        eurostat.set_requests_args(poll_interval=1.)
+    return {"queued.overhead_s": t - sdmx_server.SETTINGS["queue_time"]}
+
+
+def bench_faults(code, repeat):
+    eurostat.set_requests_args(backoff_factor=0.01)
+    def faulty():
+        sdmx_server.SETTINGS["faults"].extend([(503, dict()), (429, {"Retry-After": "0"})])
+        eurostat.get_data_df(code)
+    try:
+        t = best_time(faulty, repeat)
+        t_ok = best_time(lambda: eurostat.get_data_df(code), repeat)
+    finally:
+        eurostat.set_requests_args(backoff_factor=0.5)
+        del sdmx_server.SETTINGS["faults"][:]
+    return {"faults.2_retries_overhead_ms": 1000 * (t - t_ok)}
+
+
+def compare(report, old_report):
+    print("\n{:<45} {:>14} {:>14} {:>8}".format("result", "old", "new", "new/old"))
+    for name in sorted(report["results"]):
+        new = report["results"][name]
+        old = old_report["results"].get(name, None)
+        if old is None:
+            print("{:<45} {:>14} {:>14.4g} {:>8}".format(name, "-", new, "-"))
+        else:
+            ratio = new / old if old else float("nan")
+            print("{:<45} {:>14.4g} {:>14.4g} {:>8.2f}".format(name, old, new, ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the eurostat package.")
+    parser.add_argument("--sizes", default="small,medium",
+                        help="comma separated sizes of the datasets: " + ", ".join(SIZES))
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each measure (the best is kept)")
+    parser.add_argument("--output", default=None, help="JSON file where the report is saved")
+    parser.add_argument("--compare", default=None, help="JSON report to compare with")
+    args = parser.parse_args()
+    sizes = args.sizes.split(",")
+    assert set(sizes).issubset(SIZES), "Error: sizes must be " + ", ".join(SIZES)
+
+    srv = sdmx_server.start()
+    sdmx_server.patch(srv)
+    cache_dir = tempfile.mkdtemp()
+    eurostat.set_cache_args(data_dir=cache_dir, metadata_max_age=0.)
+    codes = dict((size, sdmx_server.make_dataset("BENCH_" + size.upper(), *SIZES[size]))
+                 for size in sizes)
+
+    results = dict()
+    results.update(bench_metadata(codes, args.repeat))
+    results.update(bench_toc(args.repeat))
+    results.update(bench_parse(codes, args.repeat))
+    results.update(bench_chunks(codes[sizes[-1]], args.repeat))
+    results.update(bench_queued(codes[sizes[0]], args.repeat))
+    results.update(bench_faults(codes[sizes[0]], args.repeat))
+    srv.shutdown()
+
+    report = {"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "sizes": dict((size, SIZES[size]) for size in sizes),
+              "repeat": args.repeat,
+              "results": results}
+    for name in sorted(results):
+        print("{:<45} {:>14.4g}".format(name, results[name]))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
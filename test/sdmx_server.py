@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Noemi E. Cazzaniga - 2024
+@email: noemi.cazzaniga@polimi.it
+"""
+
+
+## Local stand-in of the Eurostat SDMX API, used by benchmark.py.
+## It answers with the same formats as the Eurostat API (SDMX-ML structures,
+## gzipped TSV data and codelists, gzipped JSON table of contents, SOAP
+## messages of the queued requests), built from the datasets in DATASETS.
+## Every answer is kept after the first request, and then replayed
+## (until reset), with an ETag and a Last-Modified date: the conditional
+## requests are answered 304 Not Modified when they match.
+
+
+import gzip
+import json
+import threading
+import time
+import zlib
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from itertools import product
+from urllib.parse import urlparse, parse_qs
+
+
+XMLNS = 'xmlns:m="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/message" ' +\
+        'xmlns:s="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/structure" ' +\
+        'xmlns:c="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/common"'
+SOAP = '<?xml version="1.0"?><env:Envelope xmlns:env="http://schemas.xmlsoap.org/soap/envelope/">' +\
+       '<env:Body><ns0:asyncResponse xmlns:ns0="http://estat.ec.europa.eu/disschain/soap/asynchronous">' +\
+       '<ns1:status xmlns:ns1="http://estat.ec.europa.eu/disschain/asynchronous">' +\
+       '<ns1:key>%s</ns1:key><ns1:status>%s</ns1:status></ns1:status></ns0:asyncResponse></env:Body></env:Envelope>'
+FAULT = '<?xml version="1.0"?><S:Envelope xmlns:S="http://schemas.xmlsoap.org/soap/envelope/">' +\
+        '<S:Body><S:Fault><faultcode>S:Client</faultcode><faultstring>No results found</faultstring>' +\
+        '</S:Fault></S:Body></S:Envelope>'
+UPDATE = "2024-01-01T11:00:00+0100"
+
+# code: (provider, {dimension: [values]}, [periods])
+DATASETS = dict()
+# code: last update of the data, if it is not UPDATE
+UPDATE_DATA = dict()
+# latency : seconds waited before each answer
+# data_latency : seconds waited before each answer with data
+# queued : codes whose data requests are queued, as for the large datasets
+# queue_time : seconds before a queued request is available
+# faults : (status, headers) answered to the next requests, in order
+# unavailable : providers that answer 503 to all the requests
+SETTINGS = {"latency": 0., "data_latency": 0., "queued": set(), "queue_time": 0.2, "faults": [],
+            "unavailable": set()}
+LOG = []
+__fixtures__ = dict()
+__jobs__ = dict()
+__lock__ = threading.Lock()
+
+
+def make_dataset(code, n_series, n_periods, provider="EUROSTAT"):
+    """
+    Add to DATASETS a dataset of about n_series series (freq, unit, geo)
+    and n_periods yearly periods.
+    Return the code.
+    """
+
+    n_unit = max(1, int(n_series ** 0.5) // 2)
+    n_geo = max(1, n_series // n_unit)
+    DATASETS[code] = (provider,
+                      {"freq": ["A"],
+                       "unit": ["U%d" % i for i in range(n_unit)],
+                       "geo": ["G%d" % i for i in range(n_geo)]},
+                      [str(2024 - n_periods + i) for i in range(n_periods)])
+    return code
+
+
+def reset():
+    """
+    Forget the answers already sent, after a change of DATASETS or UPDATE_DATA.
+    """
+
+    with __lock__:
+        __fixtures__.clear()
+
+
+def start(port=0):
+    """
+    Start the server in a background thread.
+    Return the server.
+    """
+
+    srv = ThreadingHTTPServer(("127.0.0.1", port), __Handler__)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def patch(srv):
+    """
+    Send the requests of the eurostat package to the server.
+    """
+
+    from eurostat.eurostat import __Uri__
+    base = "http://127.0.0.1:%d/" % srv.server_address[1]
+    for prov in list(__Uri__.BASE_URL):
+        __Uri__.BASE_URL[prov] = base + prov + "/"
+        __Uri__.BASE_ASYNC_URL[prov] = base + prov + "/async/"
+
+
+def __value__(code, series, period):
+    h = zlib.crc32((code + series + period).encode()) % 1000
+    if h % 7 == 0:
+        return ": "
+    if h % 5 == 0:
+        return "%s p" % (h / 10)
+    return "%s " % (h / 10)
+
+
+def __tsv__(code, key, qs):
+    __, dims, periods = DATASETS[code]
+    names = list(dims)
+    sel = [list(dims[n]) for n in names]
+    if key:
+        for i, k in enumerate(key.split(".")):
+            if k:
+                sel[i] = [v for v in k.split("+") if v in dims[names[i]]]
+    if "startPeriod" in qs:
+        periods = [p for p in periods if p >= qs["startPeriod"][0]]
+    if "endPeriod" in qs:
+        periods = [p for p in periods if p <= qs["endPeriod"][0]]
+    lines = [",".join(names) + "\\TIME_PERIOD\t" + "\t".join(p + " " for p in periods)]
+    for series in product(*sel):
+        s = ",".join(series)
+        lines.append(s + "\t" + "\t".join(__value__(code, s, p) for p in periods))
+    return gzip.compress(("\r\n".join(lines) + "\r\n").encode(), compresslevel=1, mtime=0)
+
+
+def __dataflow__(code, detail):
+    __, dims, __ = DATASETS[code]
+    codelists = ""
+    if detail:
+        codelists = "<s:Codelists>" + "".join(
+            '<s:Codelist id="%s"><c:Name xml:lang="en">%s</c:Name>' % (d.upper(), d) +
+            '<c:Description xml:lang="en">Description of %s</c:Description>' % d +
+            "".join('<s:Code id="%s"><c:Name xml:lang="en">%s</c:Name></s:Code>' % (v, v) for v in dims[d]) +
+            "</s:Codelist>" for d in dims) + "</s:Codelists>"
+    return ('<?xml version="1.0"?><m:Structure %s><m:Structures><s:Dataflows><s:Dataflow id="%s">'
+            '<c:Annotations>'
+            '<c:Annotation><c:AnnotationTitle>%s</c:AnnotationTitle><c:AnnotationType>UPDATE_DATA</c:AnnotationType></c:Annotation>'
+            '<c:Annotation><c:AnnotationTitle>%s</c:AnnotationTitle><c:AnnotationType>UPDATE_STRUCTURE</c:AnnotationType></c:Annotation>'
+            '</c:Annotations><c:Name xml:lang="en">Title of %s</c:Name>'
+            '<s:Structure><Ref id="%s" class="DataStructure"/></s:Structure></s:Dataflow></s:Dataflows>'
+            '%s</m:Structures></m:Structure>') % (XMLNS, code, UPDATE_DATA.get(code, UPDATE), UPDATE,
+                                                  code, code, codelists)
+
+
+def __dsd__(code):
+    __, dims, __ = DATASETS[code]
+    d_list = "".join('<s:Dimension id="%s" position="%d"><s:LocalRepresentation><s:Enumeration>'
+                     '<Ref id="%s"/></s:Enumeration></s:LocalRepresentation></s:Dimension>' % (d, i + 1, d.upper())
+                     for i, d in enumerate(dims))
+    return ('<?xml version="1.0"?><m:Structure %s><m:Structures><s:DataStructures><s:DataStructure id="%s">'
+            '<s:DataStructureComponents><s:DimensionList>%s<s:TimeDimension id="TIME_PERIOD" position="%d"/>'
+            '</s:DimensionList></s:DataStructureComponents></s:DataStructure></s:DataStructures>'
+            '</m:Structures></m:Structure>') % (XMLNS, code, d_list, len(dims) + 1)
+
+
+def __constraint__(code):
+    __, dims, __ = DATASETS[code]
+    kv = "".join('<c:KeyValue id="%s">%s</c:KeyValue>' % (d, "".join("<c:Value>%s</c:Value>" % v for v in dims[d]))
+                 for d in dims)
+    return ('<?xml version="1.0"?><m:Structure %s><m:Structures><s:Constraints><s:ContentConstraint id="%s">'
+            '<s:CubeRegion include="true">%s</s:CubeRegion></s:ContentConstraint></s:Constraints>'
+            '</m:Structures></m:Structure>') % (XMLNS, code, kv)
+
+
+def __codelist__(codelist):
+    values = []
+    for __, dims, __ in DATASETS.values():
+        values.extend(v for v in dims.get(codelist.lower(), []) if v not in values)
+    if not values:
+        return None
+    body = "".join("%s\tLabel of %s\r\n" % (v, v) for v in values)
+    return gzip.compress(body.encode(), mtime=0)
+
+
+def __toc__(provider):
+    items = []
+    for code, (prov, __, periods) in DATASETS.items():
+        if prov == provider:
+            items.append({"label": "Title of " + code, "class": "dataset",
+                          "extension": {"id": code, "agencyId": "ESTAT", "annotation": [
+                              {"type": "UPDATE_DATA", "date": UPDATE_DATA.get(code, UPDATE)},
+                              {"type": "UPDATE_STRUCTURE", "date": UPDATE},
+                              {"type": "OBS_PERIOD_OVERALL_OLDEST", "title": periods[0]},
+                              {"type": "OBS_PERIOD_OVERALL_LATEST", "title": periods[-1]}]}})
+    return items
+
+
+def __answer__(provider, parts, qs):
+    """
+    Build the answer to a request.
+    Return (status, content type, body).
+    """
+
+    xml = "application/xml"
+    gz = "application/octet-stream"
+    if parts[0] == "dataflow" and len(parts) == 2 and parts[1] == "all":
+        return 200, gz, gzip.compress(json.dumps({"link": {"item": __toc__(provider)}}).encode(), mtime=0)
+    code = parts[2].upper() if parts[0] != "data" else parts[1].upper()
+    if parts[0] == "codelist":
+        body = __codelist__(parts[2])
+        return (404, xml, FAULT) if body is None else (200, gz, body)
+    if code not in DATASETS or DATASETS[code][0] != provider:
+        return 404, xml, FAULT
+    if parts[0] == "dataflow":
+        if qs.get("format") == ["JSON"]:
+            item = [i for i in __toc__(provider) if i["extension"]["id"] == code][0]
+            return 200, gz, gzip.compress(json.dumps(item).encode(), mtime=0)
+        return 200, xml, __dataflow__(code, "detail" in qs)
+    if parts[0] == "datastructure":
+        return 200, xml, __dsd__(code)
+    if parts[0] == "contentconstraint":
+        return 200, xml, __constraint__(code)
+    if parts[0] == "data":
+        return 200, gz, __tsv__(code, parts[2] if len(parts) > 2 else "", qs)
+    return 404, xml, FAULT
+
+
+class __Handler__(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def __send__(self, status, ctype, body, headers=dict()):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        for k in headers:
+            self.send_header(k, headers[k])
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        qs = parse_qs(url.query)
+        provider, *parts = url.path.strip("/").split("/")
+        with __lock__:
+            LOG.append(self.path)
+            fault = SETTINGS["faults"].pop(0) if SETTINGS["faults"] else None
+        time.sleep(SETTINGS["latency"])
+        if fault is None and provider in SETTINGS["unavailable"]:
+            fault = (503, dict())
+        if fault is not None:
+            return self.__send__(fault[0], "text/plain", "fault", fault[1])
+        if parts[0] == "async":
+            key = parts[2]
+            if parts[1] == "status":
+                status = "AVAILABLE" if time.time() >= __jobs__[key][1] else "PROCESSING"
+                return self.__send__(200, "application/xml", SOAP % (key, status))
+            return self.__send__(*__fixtures__[__jobs__[key][0]])
+        if parts[0] == "data":
+            time.sleep(SETTINGS["data_latency"])
+            if parts[1].upper() in SETTINGS["queued"]:
+                with __lock__:
+                    key = "K%d" % len(__jobs__)
+                    __jobs__[key] = (self.path, time.time() + SETTINGS["queue_time"])
+                self.__answer_fixture__(provider, parts, qs)
+                return self.__send__(200, "application/xml", SOAP % (key, "SUBMITTED"))
+        answer = self.__answer_fixture__(provider, parts, qs)
+        if answer[0] == 200 and self.__is_not_modified__(answer[3]):
+            return self.__send__(304, answer[1], b"", answer[3])
+        self.__send__(*answer)
+
+    def __answer_fixture__(self, provider, parts, qs):
+        """
+        Return (status, content type, body, headers) of the answer,
+        with the validators of the answers with status 200.
+        """
+
+        answer = __fixtures__.get(self.path, None)
+        if answer is None:
+            status, ctype, body = __answer__(provider, parts, qs)
+            headers = dict()
+            if status == 200:
+                headers["ETag"] = '"%08x"' % zlib.crc32(body.encode() if isinstance(body, str) else body)
+                headers["Last-Modified"] = formatdate(usegmt=True)
+            answer = (status, ctype, body, headers)
+            with __lock__:
+                __fixtures__[self.path] = answer
+        return answer
+
+    def __is_not_modified__(self, headers):
+        """
+        If-None-Match is used instead of If-Modified-Since, when both are sent.
+        """
+
+        if self.headers.get("If-None-Match") is not None:
+            return headers["ETag"] in [t.strip() for t in self.headers["If-None-Match"].split(",")]
+        if self.headers.get("If-Modified-Since") is not None:
+            try:
+                return parsedate_to_datetime(headers["Last-Modified"]) <= \
+                    parsedate_to_datetime(self.headers["If-Modified-Since"])
+            except (TypeError, ValueError):
+                return False
+        return False
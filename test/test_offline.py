@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Noemi E. Cazzaniga - 2024
+@email: noemi.cazzaniga@polimi.it
+"""
+
+
+## Offline checks of the package, against the local stand-in
+## of the Eurostat API in sdmx_server.py: no network is needed.
+##
+## python test/test_offline.py
+##
+## The checks can also be run by pytest.
+
+
+import asyncio
+import math
+import shutil
+import sys
+import tempfile
+import time
+from os import path
+from requests import HTTPError
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+
+import eurostat
+import sdmx_server
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+# the series are not in alphabetical order, as in some Eurostat datasets
+DIMS = {"freq": ["A"], "unit": ["U1", "U0"], "geo": ["G2", "G0", "G1"]}
+__server__ = dict()
+
+
+def setup_module():
+    srv = sdmx_server.start()
+    sdmx_server.patch(srv)
+    __server__["srv"] = srv
+    __server__["cache_dir"] = tempfile.mkdtemp()
+    eurostat.set_cache_args(data_dir=__server__["cache_dir"], metadata_max_age=0.)
+    sdmx_server.DATASETS["CHECK_A"] = ("EUROSTAT", DIMS, ["2019", "2020", "2021", "2022"])
+
+
+def teardown_module():
+    __server__["srv"].shutdown()
+    shutil.rmtree(__server__["cache_dir"], ignore_errors=True)
+
+
+def __rows__(data):
+    """
+    Return the rows of a list of tuples, a dataframe or a pyarrow table
+    as a list of tuples, with None for the missing values.
+    """
+
+    if pyarrow is not None and isinstance(data, pyarrow.Table):
+        return [tuple(data.column_names), ] + [tuple(row.values()) for row in data.to_pylist()]
+    if not isinstance(data, list):
+        data = [tuple(data.columns), ] + list(data.itertuples(index=False, name=None))
+    return [tuple(None if type(v) is float and math.isnan(v) else v for v in row) for row in data]
+
+
+def test_parsers():
+    for flags in [False, True]:
+        data = eurostat.get_data("CHECK_A", flags)
+        assert len(data) == 7
+        assert __rows__(eurostat.get_data_df("CHECK_A", flags)) == __rows__(data)
+        if pyarrow is not None:
+            assert __rows__(eurostat.get_data_arrow("CHECK_A", flags)) == __rows__(data)
+
+
+def test_iter_data():
+    for flags in [False, True]:
+        assert list(eurostat.iter_data("CHECK_A", flags)) == eurostat.get_data("CHECK_A", flags)
+        filter_pars = {"geo": ["G0", "G1"], "startPeriod": 2020}
+        assert list(eurostat.iter_data("CHECK_A", flags, filter_pars=filter_pars)) == \
+            eurostat.get_data("CHECK_A", flags, filter_pars=filter_pars)
+
+
+def test_incremental():
+    for flags in [False, True]:
+        sdmx_server.DATASETS["CHECK_I"] = ("EUROSTAT", DIMS, ["2019", "2020", "2021"])
+        sdmx_server.UPDATE_DATA["CHECK_I"] = "2024-02-01T11:00:00+0100"
+        sdmx_server.reset()
+        eurostat.clear_cache("CHECK_I")
+        eurostat.get_data_df("CHECK_I", flags, cache=True, incremental=True)
+        # a new period, and the last one revised
+        sdmx_server.DATASETS["CHECK_I"] = ("EUROSTAT", DIMS, ["2019", "2020", "2021", "2022"])
+        sdmx_server.UPDATE_DATA["CHECK_I"] = "2024-03-01T11:00:00+0100"
+        sdmx_server.reset()
+        n = len(sdmx_server.LOG)
+        df = eurostat.get_data_df("CHECK_I", flags, cache=True, incremental=True)
+        assert [u for u in sdmx_server.LOG[n:] if "/data/" in u] == \
+            ["/EUROSTAT/data/CHECK_I?startPeriod=2021&format=TSV&compressed=true"]
+        full = eurostat.get_data_df("CHECK_I", flags)
+        assert list(df.columns) == list(full.columns)
+        assert __rows__(df) == __rows__(full)
+
+
+
+def test_incremental_frequencies():
+    # monthly and quarterly periods have the same length
+    dims = {"freq": ["M", "Q"], "geo": ["G1", "G0"]}
+    sdmx_server.DATASETS["CHECK_F"] = ("EUROSTAT", dims, ["2021-11", "2021-12", "2021-Q4"])
+    sdmx_server.UPDATE_DATA["CHECK_F"] = "2024-02-01T11:00:00+0100"
+    sdmx_server.reset()
+    eurostat.get_data_df("CHECK_F", cache=True, incremental=True)
+    sdmx_server.DATASETS["CHECK_F"] = ("EUROSTAT", dims, ["2021-11", "2021-12", "2022-01", "2021-Q4"])
+    sdmx_server.UPDATE_DATA["CHECK_F"] = "2024-03-01T11:00:00+0100"
+    sdmx_server.reset()
+    n = len(sdmx_server.LOG)
+    df = eurostat.get_data_df("CHECK_F", cache=True, incremental=True)
+    assert [u for u in sdmx_server.LOG[n:] if "/data/" in u] == \
+        ["/EUROSTAT/data/CHECK_F?format=TSV&compressed=true"]
+    assert __rows__(df) == __rows__(eurostat.get_data_df("CHECK_F"))
+
+
+def test_conditional_requests():
+    events = []
+
+    def listener(event):
+        if event["event"] == "cache" and event["kind"] == "http":
+            events.append(event["hit"])
+
+    eurostat.set_cache_args(toc_max_age=0.)
+    eurostat.clear_cache()
+    eurostat.get_pars("CHECK_A")
+    eurostat.get_toc()
+    eurostat.add_listener(listener)
+    try:
+        eurostat.clear_cache("CHECK_A")
+        eurostat.get_pars("CHECK_A")
+        eurostat.get_toc()
+        # the structure and the table of contents are not modified
+        assert events != [] and all(events)
+        del events[:]
+        sdmx_server.DATASETS["CHECK_C"] = ("EUROSTAT", DIMS, ["2022"])
+        sdmx_server.reset()
+        eurostat.get_toc()
+        assert events != [] and not all(events)
+    finally:
+        eurostat.remove_listener(listener)
+        eurostat.set_cache_args(toc_max_age=3600.)
+
+
+def test_unavailable_provider():
+    sdmx_server.DATASETS["CHECK_G"] = ("GROW", DIMS, ["2022"])
+    sdmx_server.reset()
+    sdmx_server.SETTINGS["unavailable"].add("GROW")
+    eurostat.set_requests_args(backoff_factor=0.01)
+    eurostat.set_cache_args(toc_max_age=0.)
+    try:
+        for toc in [eurostat.get_toc(), eurostat.get_toc()]:
+            codes = [row[1].upper() for row in toc[1:]]
+            assert "CHECK_A" in codes and "CHECK_G" not in codes
+        if aiohttp is not None:
+            codes = [row[1].upper() for row in asyncio.run(eurostat.get_toc_async())[1:]]
+            assert "CHECK_A" in codes and "CHECK_G" not in codes
+    finally:
+        sdmx_server.SETTINGS["unavailable"].discard("GROW")
+        eurostat.set_requests_args(backoff_factor=0.5)
+        eurostat.set_cache_args(toc_max_age=3600.)
+    codes = [row[1].upper() for row in eurostat.get_toc()[1:]]
+    assert "CHECK_G" in codes
+
+
+def test_queued_timeout():
+    sdmx_server.SETTINGS["queued"].add("CHECK_A")
+    eurostat.set_requests_args(poll_interval=0.05, poll_timeout=0.1)
+    try:
+        try:
+            eurostat.get_data("CHECK_A")
+            assert False, "TimeoutError not raised"
+        except TimeoutError:
+            pass
+        eurostat.set_requests_args(poll_timeout=3600.)
+        # the next queued requests are polled again
+        assert eurostat.get_data("CHECK_A") == __rows__(eurostat.get_data_df("CHECK_A"))
+    finally:
+        sdmx_server.SETTINGS["queued"].discard("CHECK_A")
+        eurostat.set_requests_args(poll_interval=1., poll_timeout=3600.)
+
+
+def test_failing_listener():
+    def listener(event):
+        raise RuntimeError("failing listener")
+
+    data = eurostat.get_data("CHECK_A", True)
+    eurostat.add_listener(listener)
+    try:
+        with eurostat.collect_stats() as stats:
+            assert eurostat.get_data("CHECK_A", True) == data
+        assert stats["requests"] > 0
+    finally:
+        eurostat.remove_listener(listener)
+
+
+def test_retry_after():
+    data = eurostat.get_data("CHECK_A")
+    sdmx_server.SETTINGS["faults"].append((429, {"Retry-After": "0"}))
+    assert eurostat.get_data("CHECK_A") == data
+    for retry_after in ["86400", "Fri, 01 Jan 2100 00:00:00 GMT"]:
+        sdmx_server.SETTINGS["faults"].append((429, {"Retry-After": retry_after}))
+        t = time.time()
+        try:
+            eurostat.get_data("CHECK_A")
+            assert False, "HTTPError not raised"
+        except HTTPError as e:
+            assert e.response.status_code == 429
+        assert time.time() - t < 10.
+    del sdmx_server.SETTINGS["faults"][:]
+
+
+if __name__ == "__main__":
+    setup_module()
+    try:
+        for name in ["test_parsers", "test_iter_data", "test_incremental",
+                     "test_incremental_frequencies", "test_conditional_requests",
+                     "test_unavailable_provider", "test_queued_timeout",
+                     "test_failing_listener", "test_retry_after"]:
+            globals()[name]()
+            print(name, "ok")
+    finally:
+        teardown_module()